@@ -1,20 +1,24 @@
 from langgraph.graph import StateGraph, START, END
 from typing import TypedDict, List, Dict
-from openai import OpenAI
 from services.embeddings import embed
-from services.neo4j_client import neo4j_client
+from services.entity_matcher import match_entities
+from services.llm import get_provider
 from services.rerank import rerank
-
-client = OpenAI()
+from services.retrieval import search_collections, search_communities
 
 
 class State(TypedDict):
     """State passed between nodes in the RAG workflow."""
     query: str
     workspace_id: str
-    collection_id: str
+    collection_ids: List[str]
+    search_timeout: float
+    mode: str
+    expand_options: Dict
     key_entities: List[str]
+    seed_entity_ids: List[str]
     retrieved_chunks: List[Dict]
+    retrieval_info: Dict
     context: str
     answer: str
 
@@ -24,10 +28,21 @@ def plan(state: State) -> State:
     Analyze the query and extract key entities/concepts.
     
     This helps focus retrieval on relevant parts of the graph.
+    Known entities are matched locally against the collections' entity
+    names first; the LLM is only asked when nothing matches.
     """
     query = state["query"]
     
-    response = client.chat.completions.create(
+    # Fast path: dictionary match against known entities, used as retrieval seeds
+    matches = match_entities(query, state["collection_ids"])
+    if matches:
+        return {
+            **state,
+            "key_entities": list(dict.fromkeys(m["name"] for m in matches)),
+            "seed_entity_ids": list(dict.fromkeys(m["id"] for m in matches))
+        }
+    
+    key_entities_str = get_provider().chat(
         model="gpt-4o-mini",
         messages=[
             {
@@ -42,12 +57,12 @@ def plan(state: State) -> State:
         temperature=0
     )
     
-    key_entities_str = response.choices[0].message.content
     key_entities = [e.strip() for e in key_entities_str.split(",")]
     
     return {
         **state,
-        "key_entities": key_entities
+        "key_entities": key_entities,
+        "seed_entity_ids": []
     }
 
 
@@ -59,47 +74,53 @@ def retrieve(state: State) -> State:
     1. Vector search for similar chunks
     2. Expand to connected entities and relationships
     3. Rerank by relevance
+    
+    In "global" mode, searches precomputed community summaries instead of
+    raw chunks, for corpus-wide questions.
     """
     query = state["query"]
-    workspace_id = state["workspace_id"]
-    collection_id = state["collection_id"]
     
     # Generate query embedding
     query_embedding = embed(query)
     
-    # Vector search for relevant chunks
-    vector_results = neo4j_client.read("""
-        CALL db.index.vector.queryNodes('chunk_embeddings', 10, $query_vector)
-        YIELD node, score
-        
-        // Filter by workspace and collection
-        MATCH (node)-[:SECTION_OF]->(d:Document)
-        MATCH (d)<-[:HAS_DOC]-(c:Collection {id: $collection_id})
-        MATCH (c)<-[:HAS_COLLECTION]-(w:Workspace {id: $workspace_id})
-        
-        // Get connected entities and relationships
-        OPTIONAL MATCH (node)-[:MENTIONS]->(e:Entity)
-        OPTIONAL MATCH (e)-[r:RELATES_TO]->(related:Entity)
-        
-        RETURN 
-            node.id as chunk_id,
-            node.content as content,
-            score,
-            collect(DISTINCT {name: e.name, type: e.type}) as entities,
-            collect(DISTINCT {source: e.name, target: related.name, type: r.kind}) as relationships
-        ORDER BY score DESC
-    """, {
-        "query_vector": query_embedding,
-        "workspace_id": workspace_id,
-        "collection_id": collection_id
-    })
+    if state.get("mode") == "global":
+        summaries = search_communities(
+            query_embedding,
+            state["workspace_id"],
+            state["collection_ids"]
+        )
+        return {
+            **state,
+            "retrieved_chunks": [{**s, "rerank_score": s["score"]} for s in summaries],
+            "retrieval_info": {
+                "collections": state["collection_ids"],
+                "timed_out": [],
+                "failed": [],
+                "partial": False
+            }
+        }
+    
+    # Vector search for relevant chunks in every requested collection
+    vector_results, retrieval_info = search_collections(
+        query_embedding,
+        state["workspace_id"],
+        state["collection_ids"],
+        limit=10,
+        timeout=state.get("search_timeout", 5.0),
+        seed_entity_ids=state.get("seed_entity_ids", []),
+        **state.get("expand_options", {})
+    )
+    
+    # Normalization bounds only matter for paging searches
+    retrieval_info.pop("score_bounds", None)
     
     # Rerank results
     reranked = rerank(vector_results, top_k=5)
     
     return {
         **state,
-        "retrieved_chunks": reranked
+        "retrieved_chunks": reranked,
+        "retrieval_info": retrieval_info
     }
 
 
@@ -155,7 +176,7 @@ def write(state: State) -> State:
     query = state["query"]
     context = state["context"]
     
-    response = client.chat.completions.create(
+    answer = get_provider().chat(
         model="gpt-4o-mini",
         messages=[
             {
@@ -182,8 +203,6 @@ Answer:"""
         temperature=0.7
     )
     
-    answer = response.choices[0].message.content
-    
     return {
         **state,
         "answer": answer
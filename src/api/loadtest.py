@@ -0,0 +1,372 @@
+"""
+In-process load test for the API.
+
+Runs the FastAPI app against stand-in Neo4j and LLM backends with
+configurable latency, drives a mix of /rag/answer, /rag/search and
+/ingest/upload at a target request rate, and reports latency percentiles,
+throughput and event-loop lag. Blocking calls made on the event loop show
+up as lag and as latency spikes on every route.
+
+Usage:
+    python loadtest.py --rate 20 --duration 30 --mix answer=0.3,search=0.6,upload=0.1
+    python loadtest.py --save-baseline baseline.json
+    python loadtest.py --compare baseline.json --tolerance 0.2 --min-delta-ms 25
+
+The embedding tokenizer is preloaded before the run; if it cannot be
+downloaded (offline), uploads count whitespace-separated words instead.
+"""
+from typing import List, Dict, Any
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+import httpx
+
+from services import embeddings, writer
+from services.llm import LocalProvider, set_provider
+from services.neo4j_client import neo4j_client
+
+ROUTES = ("answer", "search", "upload")
+
+QUERIES = [
+    "Who invented the telephone?",
+    "What are the main themes in this collection?",
+    "How does PageRank work?",
+    "Which companies did Alan Turing work with?",
+    "Summarize the history of graph databases",
+    "What is retrieval augmented generation?",
+    "Where was the Enigma machine used?",
+    "Explain the relationship between entities and chunks",
+]
+
+UPLOAD_TEXT = (
+    "Graph databases store data as nodes and relationships. "
+    "Neo4j is a graph database developed by Neo4j Inc. "
+) * 40
+
+
+class _FakeResult:
+    def __init__(self, rows: List[Dict]):
+        self.rows = rows
+
+    def data(self) -> List[Dict]:
+        return self.rows
+
+    def __iter__(self):
+        return iter(_FakeRecord(row) for row in self.rows)
+
+
+class _FakeRecord:
+    def __init__(self, row: Dict):
+        self.row = row
+
+    def data(self) -> Dict:
+        return self.row
+
+
+class _FakeSession:
+    def __init__(self, driver: "FakeDriver"):
+        self.driver = driver
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, query: str, parameters: Dict[str, Any] = None) -> _FakeResult:
+        # Blocking on purpose: the real driver is synchronous too
+        time.sleep(self.driver.latency)
+        return _FakeResult(self.driver.rows_for(query, parameters or {}))
+
+    def execute_read(self, fn):
+        return fn(self)
+
+    def execute_write(self, fn):
+        return fn(self)
+
+
+class FakeDriver:
+    """Stand-in for the Neo4j driver returning synthetic rows after a fixed latency."""
+
+    def __init__(self, latency: float = 0.005, results_per_query: int = 10):
+        self.latency = latency
+        self.results_per_query = results_per_query
+
+    def session(self) -> _FakeSession:
+        return _FakeSession(self)
+
+    def verify_connectivity(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    def _chunk(self, i: int) -> Dict:
+        return {
+            "chunk_id": f"doc:chunk:{i}",
+            "content": f"Synthetic chunk {i} about graph databases.",
+            "chunk_index": i,
+            "document_id": "doc",
+            "filename": "doc.txt",
+            "centrality": 0.5,
+            "seed_hits": 0,
+            "score": 1.0 - i * 0.01,
+            "entities": [{"id": f"entity:{i}", "name": f"Entity {i}", "type": "Concept"}],
+            "relationships": [{"source": f"Entity {i}", "target": f"Entity {i + 1}", "type": "RELATES_TO"}],
+            "context": None,
+        }
+
+    def rows_for(self, query: str, parameters: Dict[str, Any]) -> List[Dict]:
+        if "SHOW INDEXES" in query:
+            return [{"state": "ONLINE"}]
+        if "chunk_embeddings" not in query:
+            return []
+
+        count = min(parameters.get("limit", self.results_per_query), self.results_per_query)
+        if "queries" in parameters:
+            return [
+                {"query_index": q["index"], **self._chunk(i)}
+                for q in parameters["queries"]
+                for i in range(count)
+            ]
+        return [self._chunk(i) for i in range(count)]
+
+
+def _prepare_tokenizer() -> None:
+    """Load the tokenizer up front, or fall back to word counts if it is unavailable."""
+    try:
+        embeddings._count_tokens("warm up")
+    except Exception as e:
+        print(f"Tokenizer unavailable ({type(e).__name__}), counting words instead")
+        embeddings._count_tokens = writer._count_tokens = lambda text: len(text.split())
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile (0 for no values)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def _summary(latencies: List[float], errors: int, duration: float) -> Dict[str, float]:
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": len(latencies) / duration if duration else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def _monitor_loop_lag(samples: List[float], stop: asyncio.Event, interval: float = 0.01) -> None:
+    """Record how late the event loop wakes up from a short sleep."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - start - interval))
+
+
+async def _send(client: httpx.AsyncClient, route: str, args) -> int:
+    query = random.choice(QUERIES[:args.distinct_queries])
+    params = {"query": query, "workspace_id": args.workspace_id, "collection_id": args.collection_id}
+
+    if route == "answer":
+        response = await client.get("/rag/answer", params=params)
+    elif route == "search":
+        response = await client.get("/rag/search", params=params)
+    else:
+        response = await client.post(
+            "/ingest/upload",
+            files={"file": (f"load-{random.randrange(10 ** 9)}.txt", UPLOAD_TEXT.encode("utf-8"), "text/plain")},
+            data={"workspace_id": args.workspace_id, "collection_id": args.collection_id},
+            headers={"X-Workspace-Id": args.workspace_id},
+        )
+    return response.status_code
+
+
+async def run(args) -> Dict[str, Any]:
+    """Run one load test and return its report."""
+    neo4j_client.driver = FakeDriver(latency=args.neo4j_latency)
+    set_provider(LocalProvider(latency=args.llm_latency))
+    _prepare_tokenizer()
+
+    # Imported after the stand-ins are in place
+    from main import app
+
+    routes, weights = zip(*args.mix.items())
+    latencies = {route: [] for route in routes}
+    errors = {route: 0 for route in routes}
+    lag_samples: List[float] = []
+    stop = asyncio.Event()
+    in_flight = asyncio.Semaphore(args.max_in_flight)
+
+    async def one(route: str) -> None:
+        async with in_flight:
+            start = time.perf_counter()
+            try:
+                status = await _send(client, route, args)
+            except Exception:
+                status = 599
+            if status < 400:
+                latencies[route].append(time.perf_counter() - start)
+            else:
+                errors[route] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=None) as client:
+        monitor = asyncio.create_task(_monitor_loop_lag(lag_samples, stop))
+        tasks = []
+        started = time.perf_counter()
+
+        # Open-loop Poisson arrivals at the target rate
+        while time.perf_counter() - started < args.duration:
+            route = random.choices(routes, weights)[0]
+            tasks.append(asyncio.create_task(one(route)))
+            await asyncio.sleep(random.expovariate(args.rate))
+
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+        stop.set()
+        await monitor
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "config": {
+            "rate": args.rate,
+            "duration": args.duration,
+            "mix": args.mix,
+            "neo4j_latency": args.neo4j_latency,
+            "llm_latency": args.llm_latency,
+        },
+        "routes": {route: _summary(latencies[route], errors[route], elapsed) for route in routes},
+        "overall": _summary(all_latencies, sum(errors.values()), elapsed),
+        "loop_lag": {
+            "p50_ms": percentile(lag_samples, 50) * 1000,
+            "p99_ms": percentile(lag_samples, 99) * 1000,
+            "max_ms": max(lag_samples, default=0.0) * 1000,
+        },
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"{'route':<10}{'reqs':>7}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in list(report["routes"].items()) + [("overall", report["overall"])]:
+        print(
+            f"{name:<10}{stats['requests']:>7}{stats['errors']:>8}{stats['throughput_rps']:>9.1f}"
+            f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    lag = report["loop_lag"]
+    print(f"event loop lag: p50 {lag['p50_ms']:.1f} ms, p99 {lag['p99_ms']:.1f} ms, max {lag['max_ms']:.1f} ms")
+
+
+def _error_rate(stats: Dict[str, float]) -> float:
+    return stats["errors"] / stats["requests"] if stats["requests"] else 0.0
+
+
+def compare(
+    report: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float,
+    min_delta_ms: float,
+    max_error_increase: float
+) -> List[str]:
+    """
+    Compare a run against a baseline.
+
+    Returns:
+        Regressions where p95/p99 latency or loop lag grew by more than
+        `tolerance` and by more than `min_delta_ms` (so jitter on near-zero
+        baselines does not count), where the error rate grew by more than
+        `max_error_increase`, or where throughput fell by more than `tolerance`
+        (failed requests are fast, so latency alone would miss them)
+    """
+    regressions = []
+    pairs = [
+        (f"{route} {metric}", report["routes"][route][metric], baseline["routes"][route][metric])
+        for route in report["routes"] if route in baseline["routes"]
+        for metric in ("p95_ms", "p99_ms")
+    ]
+    pairs.append(("loop lag p99_ms", report["loop_lag"]["p99_ms"], baseline["loop_lag"]["p99_ms"]))
+
+    for name, current, previous in pairs:
+        change = (current - previous) / previous if previous else 0.0
+        print(f"{name:<22}{previous:>10.1f} -> {current:>10.1f} ms ({change:+.0%})")
+        if change > tolerance and current - previous > min_delta_ms:
+            regressions.append(name)
+
+    sections = [(route, report["routes"][route], baseline["routes"][route])
+                for route in report["routes"] if route in baseline["routes"]]
+    sections.append(("overall", report["overall"], baseline["overall"]))
+    for route, current, previous in sections:
+        current_rate, previous_rate = _error_rate(current), _error_rate(previous)
+        print(f"{route + ' error rate':<22}{previous_rate:>10.1%} -> {current_rate:>10.1%}")
+        if current_rate - previous_rate > max_error_increase:
+            regressions.append(f"{route} error rate")
+
+        current_rps, previous_rps = current["throughput_rps"], previous["throughput_rps"]
+        print(f"{route + ' throughput':<22}{previous_rps:>10.1f} -> {current_rps:>10.1f} rps")
+        if current_rps < previous_rps * (1 - tolerance):
+            regressions.append(f"{route} throughput")
+    return regressions
+
+
+def _parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        route, _, weight = part.partition("=")
+        if route not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown route {route!r}, expected one of {ROUTES}")
+        mix[route] = float(weight)
+    return mix
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="In-process load test for the Graph RAG API")
+    parser.add_argument("--rate", type=float, default=20.0, help="Target requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to generate load")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("answer=0.3,search=0.6,upload=0.1"),
+                        help="Route weights, e.g. answer=0.3,search=0.6,upload=0.1")
+    parser.add_argument("--neo4j-latency", type=float, default=0.005, help="Seconds per stand-in Neo4j query")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per stand-in LLM/embedding call")
+    parser.add_argument("--distinct-queries", type=int, default=len(QUERIES), help="Size of the query pool")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="Cap on concurrent requests")
+    parser.add_argument("--workspace-id", default="loadtest")
+    parser.add_argument("--collection-id", default="loadtest")
+    parser.add_argument("--save-baseline", help="Write the report to this JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=25.0,
+                        help="Absolute increase in ms below which a metric never counts as regressed")
+    parser.add_argument("--max-error-increase", type=float, default=0.01,
+                        help="Allowed absolute increase in error rate (0.01 = one point)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance, args.min_delta_ms, args.max_error_increase)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}")
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
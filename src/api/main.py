@@ -2,6 +2,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routers import rag, ingest
 from services.neo4j_client import neo4j_client
+from services.admission import AdmissionMiddleware, admission
+from services.writer import create_vector_index_if_needed
+from services.communities import create_community_index_if_needed
 from contextlib import asynccontextmanager
 import uvicorn
 
@@ -11,10 +14,14 @@ async def lifespan(app: FastAPI):
     """
     Manage app lifecycle:
     - Connect to Neo4j on startup
+    - Ensure vector indexes exist, so searches work before the first upload
+      or community summarization
     - Close connection on shutdown
     """
     # Startup
     neo4j_client.connect()
+    create_vector_index_if_needed()
+    create_community_index_if_needed()
     yield
     # Shutdown
     neo4j_client.close()
@@ -22,6 +29,10 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 
+# Per-workspace/per-route admission control; sheds load with 429/503 + Retry-After.
+# Added before CORS so rejections still carry CORS headers.
+app.add_middleware(AdmissionMiddleware, controller=admission)
+
 # Add CORS middleware to allow frontend to call backend
 app.add_middleware(
     CORSMiddleware,
@@ -40,5 +51,19 @@ def read_root():
     return {"message": "Graph RAG API", "status": "running"}
 
 
+@app.get("/admission/stats")
+async def admission_stats():
+    """
+    Report admission control state for monitoring.
+    
+    Async so it reads the controller on the event loop, which owns it.
+    
+    Returns:
+        Active requests, queue depths and rejection counts per route class,
+        plus active/queued requests per workspace
+    """
+    return admission.stats()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host='0.0.0.0', port=8000)
@@ -1,22 +1,50 @@
-from fastapi import APIRouter, UploadFile, File, Form
+from fastapi import APIRouter, BackgroundTasks, HTTPException, UploadFile, File, Form, Header
 from services.writer import (
     create_workspace,
     create_collection,
     write_document,
     create_vector_index_if_needed
 )
+from services.gds import refresh_after_ingest
+from services.communities import summarize_communities
+from services.deletion import delete_document, delete_collection
+from services.jobs import submit, get_job
+from services.neo4j_client import neo4j_client
+from services.admission import workspace_header_matches
+from typing import Optional
 import json
 
 router = APIRouter(prefix='/ingest', tags=['ingest'])
 
 
+def _check_workspace_header(x_workspace_id: Optional[str], workspace_id: str) -> None:
+    """Reject a request whose X-Workspace-Id header names another workspace than its form."""
+    if not workspace_header_matches(x_workspace_id, workspace_id):
+        raise HTTPException(status_code=400, detail="X-Workspace-Id header does not match workspace_id")
+
+
+def _check_collection_workspace(x_workspace_id: Optional[str], collection_id: str) -> None:
+    """Reject a request whose X-Workspace-Id header names a workspace not owning the collection."""
+    if x_workspace_id is None:
+        return
+    found = neo4j_client.read("""
+        MATCH (:Workspace {id: $workspace_id})-[:HAS_COLLECTION]->(c:Collection {id: $collection_id})
+        RETURN c.id as collection_id
+        LIMIT 1
+    """, {"workspace_id": x_workspace_id, "collection_id": collection_id})
+    if not found:
+        raise HTTPException(status_code=404, detail="Collection not found")
+
+
 @router.post('/upload')
-async def upload(
+def upload(
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     workspace_id: str = Form(...),
     collection_id: str = Form(...),
     collection_name: str = Form(None),
-    metadata: str = Form(None)
+    metadata: str = Form(None),
+    x_workspace_id: str = Header(None)
 ):
     """
     Upload and process a document into the knowledge graph.
@@ -27,6 +55,7 @@ async def upload(
     3. Generates embeddings
     4. Extracts entities and relationships
     5. Writes everything to Neo4j
+    6. Schedules a graph centrality refresh for the collection
     
     Args:
         file: Text file to upload
@@ -34,12 +63,18 @@ async def upload(
         collection_id: Collection ID (e.g., "algorithms", "history")
         collection_name: Human-readable collection name (optional)
         metadata: JSON string with document metadata (optional)
+        x_workspace_id: X-Workspace-Id header (optional); must equal
+            workspace_id. Admission control cannot read the form and charges
+            uploads without it to a shared low-priority bucket
         
     Returns:
         Summary of ingestion (chunks, entities, relationships created)
     """
-    # Read file content
-    content = await file.read()
+    _check_workspace_header(x_workspace_id, workspace_id)
+    
+    # Read file content (a plain def route runs in the threadpool, so the
+    # blocking reads and ingest below stay off the event loop)
+    content = file.file.read()
     text = content.decode('utf-8')
     
     # Parse metadata
@@ -66,6 +101,9 @@ async def upload(
         metadata=doc_metadata
     )
     
+    # Keep precomputed centrality features in sync for the reranker
+    background_tasks.add_task(refresh_after_ingest, collection_id)
+    
     return {
         "status": "success",
         "workspace_id": workspace_id,
@@ -74,11 +112,72 @@ async def upload(
     }
 
 
+@router.post('/analytics')
+def refresh_analytics(
+    background_tasks: BackgroundTasks,
+    collection_id: str = Form(...),
+    x_workspace_id: str = Header(None)
+):
+    """
+    Recompute graph centrality features (PageRank, degree, community) for a collection.
+    
+    Runs in the background. Useful to backfill collections ingested before
+    centrality features existed.
+    
+    Args:
+        collection_id: Collection to refresh
+        x_workspace_id: X-Workspace-Id header (optional); the workspace owning
+            the collection, so admission control charges the request to it
+            instead of the shared bucket
+        
+    Returns:
+        Confirmation that the refresh was scheduled
+    """
+    _check_collection_workspace(x_workspace_id, collection_id)
+    background_tasks.add_task(refresh_after_ingest, collection_id)
+    
+    return {
+        "status": "scheduled",
+        "collection_id": collection_id
+    }
+
+
+@router.post('/communities')
+def refresh_communities(
+    background_tasks: BackgroundTasks,
+    collection_id: str = Form(...),
+    x_workspace_id: str = Header(None)
+):
+    """
+    Rebuild hierarchical community summaries for a collection.
+    
+    Runs in the background. Only communities whose membership changed since
+    the last run are re-summarized. Summaries power mode=global on /rag/answer.
+    
+    Args:
+        collection_id: Collection to summarize
+        x_workspace_id: X-Workspace-Id header (optional); the workspace owning
+            the collection, so admission control charges the request to it
+            instead of the shared bucket
+        
+    Returns:
+        Confirmation that the run was scheduled
+    """
+    _check_collection_workspace(x_workspace_id, collection_id)
+    background_tasks.add_task(summarize_communities, collection_id)
+    
+    return {
+        "status": "scheduled",
+        "collection_id": collection_id
+    }
+
+
 @router.post('/collection')
 def create_collection_endpoint(
     workspace_id: str = Form(...),
     collection_id: str = Form(...),
-    collection_name: str = Form(...)
+    collection_name: str = Form(...),
+    x_workspace_id: str = Header(None)
 ):
     """
     Create a new collection in a workspace.
@@ -87,10 +186,13 @@ def create_collection_endpoint(
         workspace_id: User/project workspace ID
         collection_id: Unique collection ID (e.g., "col_algorithms")
         collection_name: Human-readable name (e.g., "Algorithm Papers")
+        x_workspace_id: X-Workspace-Id header (optional); must equal
+            workspace_id, see upload
         
     Returns:
         Confirmation message
     """
+    _check_workspace_header(x_workspace_id, workspace_id)
     create_workspace(workspace_id)
     create_collection(workspace_id, collection_id, collection_name)
     
@@ -100,3 +202,90 @@ def create_collection_endpoint(
         "collection_id": collection_id,
         "collection_name": collection_name
     }
+
+
+@router.delete('/document', status_code=202)
+def delete_document_endpoint(
+    workspace_id: str,
+    collection_id: str,
+    document_id: str
+):
+    """
+    Delete a document from a collection as a background job.
+    
+    Removes the document's chunks and MENTIONS edges, then entities (and
+    their RELATES_TO edges) that no other chunk mentions, in bounded-size
+    throttled transactions.
+    
+    Args:
+        workspace_id: User/project workspace ID
+        collection_id: Collection the document belongs to
+        document_id: Document ID as returned by upload/search
+        
+    Returns:
+        The queued job; poll GET /ingest/jobs/{job_id} for progress
+    """
+    found = neo4j_client.read("""
+        MATCH (:Workspace {id: $workspace_id})-[:HAS_COLLECTION]->(c:Collection {id: $collection_id})
+        MATCH (c)-[:HAS_DOC]->(d:Document {id: $document_id})
+        RETURN d.id as document_id
+        LIMIT 1
+    """, {
+        "workspace_id": workspace_id,
+        "collection_id": collection_id,
+        "document_id": document_id
+    })
+    if not found:
+        raise HTTPException(status_code=404, detail="Document not found")
+    
+    job = submit(
+        "delete_document",
+        delete_document,
+        doc_id=document_id,
+        collection_id=collection_id
+    )
+    return job.to_dict()
+
+
+@router.delete('/collection', status_code=202)
+def delete_collection_endpoint(
+    workspace_id: str,
+    collection_id: str
+):
+    """
+    Delete a collection and everything in it as a background job.
+    
+    Args:
+        workspace_id: User/project workspace ID
+        collection_id: Collection to delete
+        
+    Returns:
+        The queued job; poll GET /ingest/jobs/{job_id} for progress
+    """
+    found = neo4j_client.read("""
+        MATCH (:Workspace {id: $workspace_id})-[:HAS_COLLECTION]->(c:Collection {id: $collection_id})
+        RETURN c.id as collection_id
+        LIMIT 1
+    """, {"workspace_id": workspace_id, "collection_id": collection_id})
+    if not found:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    
+    job = submit("delete_collection", delete_collection, collection_id=collection_id)
+    return job.to_dict()
+
+
+@router.get('/jobs/{job_id}')
+def job_status(job_id: str):
+    """
+    Get status and progress of a background job.
+    
+    Args:
+        job_id: ID returned when the job was queued
+        
+    Returns:
+        Job status, progress counters and result or error
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
@@ -1,17 +1,120 @@
-from fastapi import APIRouter, Query
-from services.neo4j_client import neo4j_client
-from services.embeddings import embed
-from services.rerank import rerank
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional, Iterator
+from services.embeddings import embed, embed_batch
+from services.entity_matcher import match_entities
+from services.rerank import rerank, rerank_batch
+from services.retrieval import search_collections, search_chunks_batch, list_collections, PROJECTABLE_FIELDS
+from services.singleflight import singleflight, make_key
+from services.admission import workspace_header_matches
 from langgraph.rag_graph import graph
+import base64
+import binascii
+import orjson
 
 router = APIRouter(prefix='/rag', tags=['rag'])
 
+# Deepest result a cursor can page to (candidates fetched per collection)
+MAX_SEARCH_DEPTH = 1000
+
+# Fields a search can be projected to; chunk_id and rerank_score are always kept
+SEARCH_FIELDS = PROJECTABLE_FIELDS + ("collection_id",)
+
+
+class BatchSearchRequest(BaseModel):
+    """Request body for batch search."""
+    queries: List[str] = Field(min_length=1, max_length=500, description="Search queries")
+    workspace_id: str = Field(description="User/project workspace ID")
+    collection_id: str = Field(description="Collection to search in")
+    limit: int = Field(default=10, ge=1, le=50, description="Maximum results per query")
+
+
+def _resolve_collections(workspace_id: str, collection_id: List[str], all_collections: bool) -> List[str]:
+    """Turn the collection query parameters into a de-duplicated list of collection IDs."""
+    if all_collections:
+        collection_ids = list_collections(workspace_id)
+    else:
+        collection_ids = list(dict.fromkeys(collection_id))
+    
+    if not collection_ids:
+        raise HTTPException(
+            status_code=400,
+            detail="Provide at least one collection_id or set all_collections=true"
+        )
+    return collection_ids
+
+
+def _expand_options(expansion: str, hops: int, fanout: int, edge_budget: int) -> dict:
+    """Graph expansion options for search_chunks; bounds only apply to multihop."""
+    if expansion == "multihop":
+        return {"expansion": expansion, "hops": hops, "fanout": fanout, "edge_budget": edge_budget}
+    return {"expansion": expansion}
+
+
+def _parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    """Parse a comma-separated field projection; None means all fields."""
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [name for name in names if name not in SEARCH_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown fields {unknown}; expected any of {list(SEARCH_FIELDS)}"
+        )
+    return names
+
+
+def _encode_cursor(cursor: dict) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps(cursor)).decode("ascii")
+
+
+def _decode_cursor(cursor: Optional[str]) -> Optional[dict]:
+    """Decode a cursor returned as `next_cursor` by a previous page."""
+    if cursor is None:
+        return None
+    try:
+        decoded = orjson.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        if not isinstance(decoded, dict):
+            raise ValueError("cursor is not an object")
+        after = {
+            "score": float(decoded["score"]),
+            "id": str(decoded["id"]),
+            "depth": int(decoded["depth"]),
+            "bounds": None
+        }
+        if after["depth"] < 1:
+            raise ValueError("depth must be positive")
+        if decoded.get("bounds") is not None:
+            bounds = decoded["bounds"]
+            if not isinstance(bounds, list) or len(bounds) != 2:
+                raise ValueError("bounds must be a [min, max] pair")
+            after["bounds"] = (float(bounds[0]), float(bounds[1]))
+        return after
+    except (binascii.Error, orjson.JSONDecodeError, KeyError, TypeError, ValueError, UnicodeEncodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _ndjson(results: List[dict], meta: dict) -> Iterator[bytes]:
+    """One JSON object per result line, then a trailing {"meta": ...} line."""
+    for result in results:
+        yield orjson.dumps(result) + b"\n"
+    yield orjson.dumps({"meta": meta}) + b"\n"
+
 
 @router.get('/answer')
 def answer(
     query: str,
     workspace_id: str,
-    collection_id: str
+    collection_id: List[str] = Query(default=[]),
+    all_collections: bool = False,
+    timeout: float = Query(default=5.0, gt=0, le=30),
+    mode: str = Query(default="local", pattern="^(local|global)$"),
+    expansion: str = Query(default="direct", pattern="^(direct|multihop|materialized)$"),
+    hops: int = Query(default=2, ge=1, le=3),
+    fanout: int = Query(default=10, ge=1, le=50),
+    edge_budget: int = Query(default=100, ge=1, le=500)
 ):
     """
     Generate an answer to a user question using Graph RAG.
@@ -25,24 +128,42 @@ def answer(
     Args:
         query: User's natural language question
         workspace_id: User/project workspace ID
-        collection_id: Collection to search in
+        collection_id: Collection(s) to search in (repeat the parameter for several)
+        all_collections: Search every collection in the workspace
+        timeout: Shared retrieval deadline in seconds across collections
+        mode: "local" retrieves chunks; "global" retrieves precomputed
+            community summaries for corpus-wide questions
+        expansion: "direct", bounded "multihop" or precomputed "materialized" graph context
+        hops: Max hops from mentioned entities (multihop only)
+        fanout: Max neighbours per entity per hop (multihop only)
+        edge_budget: Max relationships per collection searched (multihop only)
         
     Returns:
         JSON containing the generated answer and supporting context
     """
-    # Run the LangGraph RAG workflow
-    result = graph.invoke({
-        "query": query,
-        "workspace_id": workspace_id,
-        "collection_id": collection_id
-    })
+    collection_ids = _resolve_collections(workspace_id, collection_id, all_collections)
+    expand_options = _expand_options(expansion, hops, fanout, edge_budget)
+    
+    # Run the LangGraph RAG workflow; identical concurrent questions share one run
+    result = singleflight.do(
+        make_key("answer", query, workspace_id, sorted(collection_ids), timeout=timeout, mode=mode, **expand_options),
+        lambda: graph.invoke({
+            "query": query,
+            "workspace_id": workspace_id,
+            "collection_ids": collection_ids,
+            "search_timeout": timeout,
+            "mode": mode,
+            "expand_options": expand_options
+        })
+    )
     
     return {
         "query": query,
         "answer": result["answer"],
         "context": result["context"],
         "key_entities": result["key_entities"],
-        "sources": result["retrieved_chunks"]
+        "sources": result["retrieved_chunks"],
+        **result["retrieval_info"]
     }
 
 
@@ -50,8 +171,17 @@ def answer(
 def search(
     query: str,
     workspace_id: str,
-    collection_id: str,
-    limit: int = Query(default=10, ge=1, le=50)
+    collection_id: List[str] = Query(default=[]),
+    all_collections: bool = False,
+    limit: int = Query(default=10, ge=1, le=50),
+    timeout: float = Query(default=5.0, gt=0, le=30),
+    expansion: str = Query(default="direct", pattern="^(direct|multihop|materialized)$"),
+    hops: int = Query(default=2, ge=1, le=3),
+    fanout: int = Query(default=10, ge=1, le=50),
+    edge_budget: int = Query(default=100, ge=1, le=500),
+    fields: Optional[str] = None,
+    cursor: Optional[str] = None,
+    format: str = Query(default="json", pattern="^(json|ndjson)$")
 ):
     """
     Perform semantic search over the knowledge graph.
@@ -65,57 +195,168 @@ def search(
     Args:
         query: Search query text
         workspace_id: User/project workspace ID
-        collection_id: Collection to search in
+        collection_id: Collection(s) to search in (repeat the parameter for several)
+        all_collections: Search every collection in the workspace
         limit: Maximum number of results to return (1-50, default: 10)
+        timeout: Shared retrieval deadline in seconds across collections
+        expansion: "direct" follows every relationship of each mentioned
+            entity; "multihop" expands up to `hops` hops, keeping at most
+            `fanout` neighbours per entity and `edge_budget` edges overall;
+            "materialized" returns the context stored on each chunk at
+            ingest, with no graph traversal
+        hops: Max hops from mentioned entities (multihop only)
+        fanout: Max neighbours per entity per hop (multihop only)
+        edge_budget: Max relationships per collection searched (multihop only)
+        fields: Comma-separated fields to return per result (e.g.
+            "content,filename"); unlisted fields are not fetched from Neo4j,
+            and graph expansion only runs for "entities"/"relationships".
+            chunk_id and rerank_score are always included.
+        cursor: `next_cursor` of the previous page, to continue the ranking
+        format: "json" for one document, "ndjson" to stream one result per
+            line followed by a {"meta": ...} line
         
     Returns:
-        JSON containing matching documents, entities, and relevance scores
+        JSON containing matching documents, entities, and relevance scores.
+        If some collections timed out, `partial` is true and they are listed
+        in `timed_out`. `next_cursor` is set while more results can be paged.
+    """
+    collection_ids = _resolve_collections(workspace_id, collection_id, all_collections)
+    
+    expand_options = _expand_options(expansion, hops, fanout, edge_budget)
+    field_names = _parse_fields(fields)
+    after = _decode_cursor(cursor)
+    
+    result = singleflight.do(
+        make_key(
+            "search", query, workspace_id, sorted(collection_ids), limit=limit, timeout=timeout,
+            fields=field_names, cursor=cursor, **expand_options
+        ),
+        lambda: _search(query, workspace_id, collection_ids, limit, timeout, expand_options, field_names, after)
+    )
+    
+    if format == "ndjson":
+        meta = {key: value for key, value in result.items() if key != "results"}
+        return StreamingResponse(
+            _ndjson(result["results"], {**meta, "query": query}),
+            media_type="application/x-ndjson"
+        )
+    
+    # Coalesced callers may have spelled the query differently
+    return {**result, "query": query}
+
+
+def _search(
+    query: str,
+    workspace_id: str,
+    collection_ids: List[str],
+    limit: int,
+    timeout: float,
+    expand_options: dict,
+    fields: Optional[List[str]] = None,
+    after: Optional[dict] = None
+) -> dict:
+    """
+    Run a single search: embed, retrieve with graph expansion, rerank.
+    
+    Results are ordered by (rerank_score desc, chunk_id). A page after a
+    cursor re-runs retrieval `limit` candidates deeper than the previous
+    one and skips everything up to the cursor's position in that order.
+    Across several collections, the cursor carries the score normalization
+    bounds of the first page, so scores do not shift as the depth grows.
     """
     # Generate query embedding
     query_embedding = embed(query)
     
-    # Vector search with entity/relationship expansion
-    results = neo4j_client.read("""
-        CALL db.index.vector.queryNodes('chunk_embeddings', $limit, $query_vector)
-        YIELD node, score
-        
-        // Filter by collection
-        MATCH (node)-[:SECTION_OF]->(d:Document)
-        MATCH (d)<-[:HAS_DOC]-(c:Collection {id: $collection_id})
-        MATCH (c)<-[:HAS_COLLECTION]-(w:Workspace {id: $workspace_id})
-        
-        // Get connected entities
-        OPTIONAL MATCH (node)-[:MENTIONS]->(e:Entity)
-        
-        // Get relationships between entities
-        OPTIONAL MATCH (e)-[r:RELATES_TO]->(related:Entity)
-        
-        RETURN 
-            node.id as chunk_id,
-            node.content as content,
-            node.index as chunk_index,
-            d.id as document_id,
-            d.filename as filename,
-            score,
-            collect(DISTINCT {name: e.name, type: e.type}) as entities,
-            collect(DISTINCT {
-                source: e.name, 
-                target: related.name, 
-                type: r.kind
-            }) as relationships
-        ORDER BY score DESC
-    """, {
-        "query_vector": query_embedding,
-        "workspace_id": workspace_id,
-        "collection_id": collection_id,
-        "limit": limit
-    })
-    
-    # Rerank results
-    reranked_results = rerank(results, top_k=limit)
+    # Known entities named in the query boost the chunks that mention them
+    seed_entity_ids = [m["id"] for m in match_entities(query, collection_ids)]
+    
+    # Vector search with entity/relationship expansion, fanned out per collection
+    depth = min(after["depth"] + limit, MAX_SEARCH_DEPTH) if after else limit
+    results, info = search_collections(
+        query_embedding, workspace_id, collection_ids, depth, timeout,
+        seed_entity_ids=seed_entity_ids,
+        fields=[f for f in fields if f != "collection_id"] if fields is not None else None,
+        score_bounds=after["bounds"] if after else None,
+        **expand_options
+    )
+    bounds = info.pop("score_bounds", None)
+    
+    # Rerank all candidates; ties broken by chunk_id so pages are stable
+    ranked = rerank(results, top_k=len(results))
+    ranked.sort(key=lambda r: (-r["rerank_score"], r["chunk_id"]))
+    if after:
+        ranked = [r for r in ranked if (-r["rerank_score"], r["chunk_id"]) > (-after["score"], after["id"])]
+    page = ranked[:limit]
+    
+    # More may follow if candidates remain or the retrieval depth was exhausted
+    next_cursor = None
+    if page and (len(ranked) > limit or (len(results) >= depth and depth < MAX_SEARCH_DEPTH)):
+        next_cursor = _encode_cursor({
+            "score": page[-1]["rerank_score"],
+            "id": page[-1]["chunk_id"],
+            "depth": depth,
+            "bounds": bounds
+        })
+    
+    if fields is not None:
+        keep = {"chunk_id", "rerank_score", *fields}
+        page = [{key: value for key, value in r.items() if key in keep} for r in page]
     
     return {
         "query": query,
-        "results": reranked_results,
-        "total": len(reranked_results)
+        "results": page,
+        "total": len(page),
+        "next_cursor": next_cursor,
+        **info
     }
+
+
+@router.post('/search/batch')
+def search_batch(request: BatchSearchRequest, x_workspace_id: str = Header(None)):
+    """
+    Perform semantic search for many queries in one pass.
+    
+    All queries are embedded in a single request, retrieved with one
+    UNWIND-driven Cypher call per batch of queries, and reranked together.
+    
+    Args:
+        request: Queries plus workspace, collection and per-query limit
+        x_workspace_id: X-Workspace-Id header (optional); must equal
+            request.workspace_id. Admission control cannot read the body and
+            charges requests without it to a shared low-priority bucket
+        
+    Returns:
+        JSON containing one result list per query, in input order
+    """
+    if not workspace_header_matches(x_workspace_id, request.workspace_id):
+        raise HTTPException(status_code=400, detail="X-Workspace-Id header does not match workspace_id")
+    
+    query_embeddings = embed_batch(request.queries)
+    
+    grouped = search_chunks_batch(
+        query_embeddings,
+        request.workspace_id,
+        request.collection_id,
+        request.limit
+    )
+    
+    reranked = rerank_batch(grouped, top_k=request.limit)
+    
+    return {
+        "results": [
+            {"query": query, "results": results, "total": len(results)}
+            for query, results in zip(request.queries, reranked)
+        ],
+        "total": len(request.queries)
+    }
+
+
+@router.get('/coalesce/stats')
+def coalesce_stats():
+    """
+    Report request coalescing metrics for identical in-flight queries.
+    
+    Returns:
+        Request/execution counts and the fraction of requests that were coalesced
+    """
+    return singleflight.stats()
\ No newline at end of file
@@ -0,0 +1,320 @@
+from services.llm import INTERACTIVE, INGEST
+from starlette.responses import JSONResponse
+from collections import deque
+from dotenv import load_dotenv
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+import asyncio
+import math
+import os
+import time
+
+load_dotenv()
+
+# Requests running at once across all routes; sync handlers share the
+# threadpool (40 threads by default), so admitting more only queues there
+MAX_CONCURRENCY = int(os.getenv('ADMISSION_MAX_CONCURRENCY', '40'))
+
+# Per workspace and route class: running requests and queued requests
+WORKSPACE_CONCURRENCY = int(os.getenv('ADMISSION_WORKSPACE_CONCURRENCY', '8'))
+WORKSPACE_QUEUE = int(os.getenv('ADMISSION_WORKSPACE_QUEUE', '16'))
+
+# Requests that name no workspace (no workspace_id query parameter and no
+# X-Workspace-Id header) share one bucket with a smaller running limit, and
+# are admitted after waiters of named workspaces
+SHARED_WORKSPACE = "_shared"
+SHARED_CONCURRENCY = int(os.getenv('ADMISSION_SHARED_CONCURRENCY', '2'))
+
+# Longest Retry-After suggested to rejected clients, in seconds
+MAX_RETRY_AFTER = 60
+
+
+class RouteClass:
+    """A group of routes sharing a concurrency limit, wait queue and priority."""
+
+    def __init__(self, name: str, priority: int, concurrency: int, queue: int, wait: float):
+        prefix = f"ADMISSION_{name.upper()}_"
+        self.name = name
+        self.priority = priority
+        self.concurrency = int(os.getenv(prefix + 'CONCURRENCY', str(concurrency)))
+        self.queue = int(os.getenv(prefix + 'QUEUE', str(queue)))
+        self.wait = float(os.getenv(prefix + 'WAIT', str(wait)))
+
+
+# First matching path prefix wins
+ROUTE_CLASSES: List[Tuple[str, RouteClass]] = [
+    ("/rag/answer", RouteClass("answer", INTERACTIVE, concurrency=16, queue=64, wait=5.0)),
+    ("/rag/", RouteClass("search", INTERACTIVE, concurrency=32, queue=128, wait=2.0)),
+    ("/ingest/", RouteClass("ingest", INGEST, concurrency=4, queue=32, wait=30.0)),
+]
+
+# Cheap monitoring/status routes that must stay reachable under load
+EXEMPT_PATHS = ("/rag/coalesce/stats", "/ingest/jobs/", "/admission/stats")
+
+
+class Rejected(Exception):
+    """Raised when a request is shed instead of admitted."""
+
+    def __init__(self, status_code: int, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    def __init__(self, route_class: RouteClass, workspace_id: str):
+        self.route_class = route_class
+        self.workspace_id = workspace_id
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """
+    Admit requests under global, per-route-class and per-workspace limits.
+
+    Requests that cannot run immediately wait in a bounded FIFO queue per
+    route class until a slot frees up or their deadline passes. Freed slots
+    go to interactive classes before ingest, and within a class to named
+    workspaces before the shared bucket. When a queue is full the
+    request is rejected at once: 429 if the workspace exceeded its own
+    share, 503 if the route class as a whole is saturated.
+
+    Runs on the event loop only, so no locking is needed.
+    """
+
+    def __init__(self, route_classes: List[RouteClass], max_concurrency: int,
+                 workspace_concurrency: int, workspace_queue: int, shared_concurrency: int):
+        self.route_classes = sorted(route_classes, key=lambda rc: rc.priority)
+        self.max_concurrency = max_concurrency
+        self.workspace_concurrency = workspace_concurrency
+        self.workspace_queue = workspace_queue
+        self.shared_concurrency = shared_concurrency
+
+        self.active_total = 0
+        self.active: Dict[str, int] = {rc.name: 0 for rc in route_classes}
+        self.active_by_workspace: Dict[Tuple[str, str], int] = {}
+        self.queued_by_workspace: Dict[Tuple[str, str], int] = {}
+        self.waiters: Dict[str, deque] = {rc.name: deque() for rc in route_classes}
+
+        # Smoothed request duration per class, for Retry-After estimates
+        self.duration: Dict[str, float] = {rc.name: 0.1 for rc in route_classes}
+        self.counters: Dict[str, Dict[str, int]] = {
+            rc.name: {"admitted": 0, "queued": 0, "rejected_queue_full": 0,
+                      "rejected_workspace": 0, "rejected_timeout": 0}
+            for rc in route_classes
+        }
+
+    def _can_run(self, route_class: RouteClass, workspace_id: str) -> bool:
+        return (
+            self.active_total < self.max_concurrency
+            and self.active[route_class.name] < route_class.concurrency
+            and not self._workspace_full(route_class, workspace_id)
+        )
+
+    def _workspace_full(self, route_class: RouteClass, workspace_id: str) -> bool:
+        limit = self.shared_concurrency if workspace_id == SHARED_WORKSPACE else self.workspace_concurrency
+        return self.active_by_workspace.get((workspace_id, route_class.name), 0) >= limit
+
+    def _backlog(self, route_class: RouteClass) -> int:
+        """Waiters of a class held back by shared capacity, not just their own workspace limit."""
+        return sum(
+            1 for waiter in self.waiters[route_class.name]
+            if not self._workspace_full(route_class, waiter.workspace_id)
+        )
+
+    def _start(self, route_class: RouteClass, workspace_id: str) -> None:
+        key = (workspace_id, route_class.name)
+        self.active_total += 1
+        self.active[route_class.name] += 1
+        self.active_by_workspace[key] = self.active_by_workspace.get(key, 0) + 1
+        self.counters[route_class.name]["admitted"] += 1
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        key = (waiter.workspace_id, waiter.route_class.name)
+        self.queued_by_workspace[key] -= 1
+        if not self.queued_by_workspace[key]:
+            del self.queued_by_workspace[key]
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters, highest priority class first."""
+        for route_class in self.route_classes:
+            queue = self.waiters[route_class.name]
+            # Stable sort: FIFO among named workspaces, then the shared bucket
+            for waiter in sorted(queue, key=lambda w: w.workspace_id == SHARED_WORKSPACE):
+                if self.active_total >= self.max_concurrency:
+                    return
+                if waiter.future.done() or not self._can_run(route_class, waiter.workspace_id):
+                    continue
+                queue.remove(waiter)
+                self._dequeue(waiter)
+                self._start(route_class, waiter.workspace_id)
+                waiter.future.set_result(True)
+
+    def retry_after(self, route_class: RouteClass) -> int:
+        """Seconds until the current queue of a class should have drained."""
+        backlog = len(self.waiters[route_class.name]) + 1
+        estimate = self.duration[route_class.name] * backlog / max(1, route_class.concurrency)
+        return max(1, min(MAX_RETRY_AFTER, math.ceil(estimate)))
+
+    async def acquire(self, route_class: RouteClass, workspace_id: str) -> None:
+        """
+        Wait for a slot, or raise Rejected.
+
+        Args:
+            route_class: Route class of the request
+            workspace_id: Workspace the request belongs to
+        """
+        # Every release dispatches runnable waiters first, so any waiter left
+        # is blocked too; a request that can run need not queue behind it
+        if self._can_run(route_class, workspace_id):
+            self._start(route_class, workspace_id)
+            return
+
+        counters = self.counters[route_class.name]
+        key = (workspace_id, route_class.name)
+        if self.queued_by_workspace.get(key, 0) >= self.workspace_queue:
+            counters["rejected_workspace"] += 1
+            raise Rejected(429, "Too many requests queued for this workspace", self.retry_after(route_class))
+        # Requests waiting only on their own workspace limit are bounded by the
+        # workspace queue above, and must not crowd other workspaces out
+        if not self._workspace_full(route_class, workspace_id) and self._backlog(route_class) >= route_class.queue:
+            counters["rejected_queue_full"] += 1
+            raise Rejected(503, "Server busy, queue full", self.retry_after(route_class))
+
+        waiter = _Waiter(route_class, workspace_id)
+        self.waiters[route_class.name].append(waiter)
+        self.queued_by_workspace[key] = self.queued_by_workspace.get(key, 0) + 1
+        counters["queued"] += 1
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=route_class.wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.future.done():
+                # Granted just as the deadline hit or the client went away
+                if isinstance(e, asyncio.CancelledError):
+                    self.release(route_class, workspace_id, 0.0)
+                    raise
+                return
+            waiter.future.cancel()
+            self.waiters[route_class.name].remove(waiter)
+            self._dequeue(waiter)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            counters["rejected_timeout"] += 1
+            raise Rejected(503, "Server busy, queue deadline exceeded", self.retry_after(route_class))
+
+    def release(self, route_class: RouteClass, workspace_id: str, elapsed: float) -> None:
+        """Free a slot taken by acquire() and admit waiters."""
+        key = (workspace_id, route_class.name)
+        self.active_total -= 1
+        self.active[route_class.name] -= 1
+        self.active_by_workspace[key] -= 1
+        if not self.active_by_workspace[key]:
+            del self.active_by_workspace[key]
+        if elapsed:
+            self.duration[route_class.name] = 0.8 * self.duration[route_class.name] + 0.2 * elapsed
+        self._dispatch()
+
+    def stats(self) -> Dict:
+        """Current load, queue depths and rejection counts."""
+        workspaces: Dict[str, Dict[str, Dict[str, int]]] = {}
+        for (workspace_id, name), count in self.active_by_workspace.items():
+            workspaces.setdefault(workspace_id, {}).setdefault(name, {"active": 0, "queued": 0})["active"] = count
+        for (workspace_id, name), count in self.queued_by_workspace.items():
+            workspaces.setdefault(workspace_id, {}).setdefault(name, {"active": 0, "queued": 0})["queued"] = count
+
+        return {
+            "active": self.active_total,
+            "max_concurrency": self.max_concurrency,
+            "routes": {
+                rc.name: {
+                    "active": self.active[rc.name],
+                    "queue_depth": len(self.waiters[rc.name]),
+                    "concurrency": rc.concurrency,
+                    "queue_limit": rc.queue,
+                    "avg_duration_s": round(self.duration[rc.name], 3),
+                    **self.counters[rc.name]
+                }
+                for rc in self.route_classes
+            },
+            "workspaces": workspaces
+        }
+
+
+admission = AdmissionController(
+    [route_class for _, route_class in ROUTE_CLASSES],
+    MAX_CONCURRENCY,
+    WORKSPACE_CONCURRENCY,
+    WORKSPACE_QUEUE,
+    SHARED_CONCURRENCY
+)
+
+
+def classify(path: str) -> Optional[RouteClass]:
+    """Route class of a request path, or None if it bypasses admission."""
+    if path.startswith(EXEMPT_PATHS):
+        return None
+    for prefix, route_class in ROUTE_CLASSES:
+        if path.startswith(prefix):
+            return route_class
+    return None
+
+
+def _workspace_id(scope) -> str:
+    """
+    Workspace from the workspace_id query parameter, else the X-Workspace-Id
+    header (for routes taking workspace_id in the body, which check it
+    matches), else the shared bucket.
+    """
+    values = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("workspace_id")
+    if values:
+        return values[0]
+    for name, value in scope.get("headers", []):
+        if name == b"x-workspace-id":
+            return value.decode("latin-1")
+    return SHARED_WORKSPACE
+
+
+def workspace_header_matches(header: Optional[str], workspace_id: str) -> bool:
+    """Whether an X-Workspace-Id header, if sent, names the workspace the request body targets."""
+    return header is None or header == workspace_id
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware applying the admission controller to every HTTP request.
+
+    Routes taking workspace_id (or only a collection_id) in the body, such
+    as /ingest/upload and /rag/search/batch, are not read here. Clients
+    should send an X-Workspace-Id header, which those routes check against
+    the body; without it the request is charged to the shared bucket.
+    """
+
+    def __init__(self, app, controller: AdmissionController = admission):
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send):
+        route_class = classify(scope["path"]) if scope["type"] == "http" else None
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        workspace_id = _workspace_id(scope)
+        try:
+            await self.controller.acquire(route_class, workspace_id)
+        except Rejected as e:
+            response = JSONResponse(
+                {"detail": e.reason},
+                status_code=e.status_code,
+                headers={"Retry-After": str(e.retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(route_class, workspace_id, time.perf_counter() - start)
@@ -0,0 +1,120 @@
+from services.neo4j_client import neo4j_client
+from typing import List, Dict
+import json
+
+# Relationships kept in each chunk's materialized context
+MAX_CONTEXT_RELATIONSHIPS = 15
+
+# Relationships considered per mentioned entity when picking the top ones
+MAX_RELATIONSHIPS_PER_ENTITY = 15
+
+# Max chunks per read/write round trip
+CONTEXT_BATCH_SIZE = 500
+
+
+def build_chunk_contexts(chunk_ids: List[str]) -> Dict[str, Dict]:
+    """
+    Build the compact context record for chunks from the graph.
+
+    The record holds the chunk's entity names and types and its top outgoing
+    relationships (by target entity centrality), i.e. what the "direct"
+    retrieval expansion would traverse for, capped in size.
+
+    Args:
+        chunk_ids: Chunks to build context for
+
+    Returns:
+        Mapping of chunk ID to {"entities": [...], "relationships": [...]}
+    """
+    contexts = {}
+
+    for start in range(0, len(chunk_ids), CONTEXT_BATCH_SIZE):
+        rows = neo4j_client.read("""
+            UNWIND $chunk_ids AS chunk_id
+            MATCH (ch:Chunk {id: chunk_id})
+            OPTIONAL MATCH (ch)-[:MENTIONS]->(e:Entity)
+            WITH ch, collect(DISTINCT e) AS entities
+            // Top relationships per entity by target centrality, ordered before limiting
+            CALL {
+                WITH entities
+                UNWIND entities AS e
+                CALL {
+                    WITH e
+                    MATCH (e)-[r:RELATES_TO]->(related:Entity)
+                    RETURN r, related
+                    ORDER BY coalesce(related.centrality, 0.0) DESC
+                    LIMIT $per_entity
+                }
+                RETURN collect({
+                    source: e.name,
+                    target: related.name,
+                    type: r.kind,
+                    weight: coalesce(related.centrality, 0.0)
+                }) AS candidates
+            }
+            RETURN
+                ch.id as chunk_id,
+                [e IN entities | {name: e.name, type: e.type}] as entities,
+                candidates
+        """, {
+            "chunk_ids": chunk_ids[start:start + CONTEXT_BATCH_SIZE],
+            "per_entity": MAX_RELATIONSHIPS_PER_ENTITY
+        })
+
+        for row in rows:
+            candidates = row["candidates"]
+            candidates.sort(key=lambda r: r["weight"], reverse=True)
+
+            relationships = []
+            seen = set()
+            for r in candidates:
+                key = (r["source"], r["type"], r["target"])
+                if key not in seen:
+                    seen.add(key)
+                    relationships.append({"source": r["source"], "target": r["target"], "type": r["type"]})
+                if len(relationships) >= MAX_CONTEXT_RELATIONSHIPS:
+                    break
+
+            contexts[row["chunk_id"]] = {
+                "entities": row["entities"],
+                "relationships": relationships
+            }
+
+    return contexts
+
+
+def refresh_chunk_context(chunk_ids: List[str] = None, entity_ids: List[str] = None) -> int:
+    """
+    Rebuild and store the materialized `context` property of chunks.
+
+    Args:
+        chunk_ids: Chunks to refresh directly
+        entity_ids: Also refresh every chunk that mentions one of these entities
+
+    Returns:
+        Number of chunks refreshed
+    """
+    targets = set(chunk_ids or [])
+    if entity_ids:
+        rows = neo4j_client.read("""
+            UNWIND $entity_ids AS entity_id
+            MATCH (:Entity {id: entity_id})<-[:MENTIONS]-(ch:Chunk)
+            RETURN DISTINCT ch.id as chunk_id
+        """, {"entity_ids": list(entity_ids)})
+        targets.update(row["chunk_id"] for row in rows)
+
+    targets = sorted(targets)
+    for start in range(0, len(targets), CONTEXT_BATCH_SIZE):
+        contexts = build_chunk_contexts(targets[start:start + CONTEXT_BATCH_SIZE])
+        neo4j_client.write("""
+            UNWIND $contexts AS item
+            MATCH (ch:Chunk {id: item.chunk_id})
+            SET ch.context = item.context
+        """, {
+            "contexts": [
+                {"chunk_id": chunk_id, "context": json.dumps(context)}
+                for chunk_id, context in contexts.items()
+            ]
+        })
+
+    return len(targets)
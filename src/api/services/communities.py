@@ -0,0 +1,286 @@
+from services.neo4j_client import neo4j_client
+from services.embeddings import embed_batch
+from services.gds import refresh_centrality, label_propagation
+from services.llm import get_provider, INGEST
+from typing import List, Dict
+import hashlib
+import numpy as np
+
+MAX_LEVELS = 3
+
+# Communities smaller than this (entities at level 0, children above) are not summarized
+MIN_COMMUNITY_SIZE = 2
+
+# Prompt size caps
+MAX_PROMPT_ENTITIES = 50
+MAX_PROMPT_RELATIONSHIPS = 80
+MAX_PROMPT_CHILDREN = 20
+
+
+def _community_id(collection_id: str, level: int, entity_ids: List[str]) -> str:
+    """Stable ID derived from membership, so any membership change yields a new community."""
+    digest = hashlib.sha1("\n".join(sorted(entity_ids)).encode("utf-8")).hexdigest()[:16]
+    return f"{collection_id}:community:{level}:{digest}"
+
+
+def build_hierarchy(collection_id: str) -> List[List[Dict]]:
+    """
+    Cluster the Entity graph of a collection into hierarchical communities.
+
+    Level 0 groups entities by their precomputed `community` id. Each higher
+    level runs weighted label propagation over the graph of the previous
+    level's communities (edge weight = number of entity edges between them),
+    until no further merging happens or MAX_LEVELS is reached.
+
+    Args:
+        collection_id: Collection to cluster
+
+    Returns:
+        One list per level of communities: {id, level, entity_ids, children}
+    """
+    entities = neo4j_client.read("""
+        MATCH (e:Entity)-[:IN_COLLECTION]->(:Collection {id: $collection_id})
+        RETURN DISTINCT e.id as id, e.community as community
+    """, {"collection_id": collection_id})
+    edges = neo4j_client.read("""
+        MATCH (a:Entity)-[:IN_COLLECTION]->(:Collection {id: $collection_id})
+        WITH DISTINCT a
+        MATCH (a)-[:RELATES_TO]->(b:Entity)
+        RETURN a.id as source, b.id as target
+    """, {"collection_id": collection_id})
+
+    groups = {}
+    for entity in entities:
+        if entity["community"] is not None:
+            groups.setdefault(entity["community"], []).append(entity["id"])
+
+    level_members = [sorted(members) for members in groups.values() if len(members) >= MIN_COMMUNITY_SIZE]
+    levels = [[
+        {
+            "id": _community_id(collection_id, 0, members),
+            "level": 0,
+            "entity_ids": members,
+            "children": []
+        }
+        for members in level_members
+    ]]
+
+    for level in range(1, MAX_LEVELS):
+        previous = levels[-1]
+        if len(previous) < 2:
+            break
+
+        owner = {
+            entity_id: i
+            for i, community in enumerate(previous)
+            for entity_id in community["entity_ids"]
+        }
+        weights = {}
+        for edge in edges:
+            a, b = owner.get(edge["source"]), owner.get(edge["target"])
+            if a is not None and b is not None and a != b:
+                key = (min(a, b), max(a, b))
+                weights[key] = weights.get(key, 0) + 1
+        if not weights:
+            break
+
+        pairs = list(weights.items())
+        labels = label_propagation(
+            len(previous),
+            np.array([a for (a, _), _ in pairs], dtype=int),
+            np.array([b for (_, b), _ in pairs], dtype=int),
+            weights=np.array([w for _, w in pairs], dtype=float)
+        )
+
+        merged = {}
+        for i, label in enumerate(labels.tolist()):
+            merged.setdefault(label, []).append(previous[i])
+
+        current = []
+        for children in merged.values():
+            if len(children) < MIN_COMMUNITY_SIZE:
+                continue
+            members = sorted(e for child in children for e in child["entity_ids"])
+            current.append({
+                "id": _community_id(collection_id, level, members),
+                "level": level,
+                "entity_ids": members,
+                "children": [child["id"] for child in children]
+            })
+        if not current:
+            break
+        levels.append(current)
+
+    return levels
+
+
+def _summarize_entities(entity_ids: List[str]) -> str:
+    rows = neo4j_client.read("""
+        UNWIND $entity_ids AS entity_id
+        MATCH (e:Entity {id: entity_id})
+        RETURN e.name as name, e.type as type
+        ORDER BY coalesce(e.centrality, 0) DESC
+        LIMIT $max_entities
+    """, {"entity_ids": entity_ids, "max_entities": MAX_PROMPT_ENTITIES})
+    relationships = neo4j_client.read("""
+        UNWIND $entity_ids AS entity_id
+        MATCH (a:Entity {id: entity_id})-[r:RELATES_TO]->(b:Entity)
+        WHERE b.id IN $entity_ids
+        RETURN a.name as source, r.kind as type, b.name as target
+        ORDER BY coalesce(a.centrality, 0) + coalesce(b.centrality, 0) DESC
+        LIMIT $max_relationships
+    """, {"entity_ids": entity_ids, "max_relationships": MAX_PROMPT_RELATIONSHIPS})
+
+    entity_lines = "\n".join(f"- {row['name']} ({row['type']})" for row in rows)
+    relationship_lines = "\n".join(
+        f"- {row['source']} {row['type']} {row['target']}" for row in relationships
+    )
+    return get_provider().chat(
+        messages=[
+            {
+                "role": "system",
+                "content": "Summarize this group of related entities from a knowledge graph in one short paragraph. Name the main theme first, then the key entities and how they relate."
+            },
+            {
+                "role": "user",
+                "content": f"Entities:\n{entity_lines}\n\nRelationships:\n{relationship_lines or '- none'}"
+            }
+        ],
+        temperature=0,
+        priority=INGEST
+    )
+
+
+def _summarize_children(child_summaries: List[str]) -> str:
+    parts = "\n\n".join(
+        f"Part {i}: {summary}" for i, summary in enumerate(child_summaries[:MAX_PROMPT_CHILDREN], 1)
+    )
+    return get_provider().chat(
+        messages=[
+            {
+                "role": "system",
+                "content": "These are summaries of related topic clusters from a knowledge graph. Write one short paragraph describing the overarching theme they share and the main sub-topics."
+            },
+            {
+                "role": "user",
+                "content": parts
+            }
+        ],
+        temperature=0,
+        priority=INGEST
+    )
+
+
+def summarize_communities(collection_id: str) -> Dict:
+    """
+    Offline stage: build hierarchical communities for a collection and summarize them.
+
+    Only communities whose membership changed since the last run (i.e. whose
+    membership-derived ID does not exist yet) are summarized and embedded;
+    communities that no longer exist are deleted.
+
+    Args:
+        collection_id: Collection to summarize
+
+    Returns:
+        Summary of created, kept and deleted communities
+    """
+    # Community ids on entities must be current before clustering
+    refresh_centrality(collection_id)
+    levels = build_hierarchy(collection_id)
+
+    existing = {
+        row["id"]: row["summary"]
+        for row in neo4j_client.read("""
+            MATCH (cm:Community {collection_id: $collection_id})
+            RETURN cm.id as id, cm.summary as summary
+        """, {"collection_id": collection_id})
+    }
+    wanted = {community["id"] for level in levels for community in level}
+
+    stale = [community_id for community_id in existing if community_id not in wanted]
+    if stale:
+        neo4j_client.write("""
+            UNWIND $ids AS community_id
+            MATCH (cm:Community {id: community_id})
+            DETACH DELETE cm
+        """, {"ids": stale})
+
+    summaries = {cid: summary for cid, summary in existing.items() if cid in wanted and summary}
+    created = 0
+
+    # Bottom-up, so parents can be summarized from their children
+    for level in levels:
+        new = [community for community in level if community["id"] not in summaries]
+        if not new:
+            continue
+
+        for community in new:
+            if community["level"] == 0:
+                community["summary"] = _summarize_entities(community["entity_ids"])
+            else:
+                community["summary"] = _summarize_children(
+                    [summaries[child] for child in community["children"] if child in summaries]
+                )
+            summaries[community["id"]] = community["summary"]
+
+        embeddings = embed_batch([c["summary"] for c in new], priority=INGEST)
+
+        neo4j_client.write("""
+            UNWIND $communities AS community
+            MERGE (cm:Community {id: community.id})
+            SET cm.collection_id = $collection_id,
+                cm.level = community.level,
+                cm.size = community.size,
+                cm.summary = community.summary,
+                cm.embedding = community.embedding
+            WITH cm, community
+            CALL {
+                WITH cm, community
+                UNWIND community.entity_ids AS entity_id
+                MATCH (e:Entity {id: entity_id})
+                WHERE community.level = 0
+                MERGE (e)-[:IN_COMMUNITY]->(cm)
+            }
+            CALL {
+                WITH cm, community
+                UNWIND community.children AS child_id
+                MATCH (child:Community {id: child_id})
+                MERGE (child)-[:CHILD_OF]->(cm)
+            }
+        """, {
+            "collection_id": collection_id,
+            "communities": [
+                {
+                    "id": c["id"],
+                    "level": c["level"],
+                    "size": len(c["entity_ids"]),
+                    "summary": c["summary"],
+                    "embedding": embedding,
+                    "entity_ids": c["entity_ids"],
+                    "children": c["children"]
+                }
+                for c, embedding in zip(new, embeddings)
+            ]
+        })
+        created += len(new)
+
+    create_community_index_if_needed()
+
+    return {
+        "collection_id": collection_id,
+        "levels": len(levels),
+        "created": created,
+        "unchanged": len(wanted) - created,
+        "deleted": len(stale)
+    }
+
+
+def create_community_index_if_needed() -> None:
+    """Create vector index on Community summaries if it doesn't exist."""
+    neo4j_client.create_vector_index(
+        index_name="community_embeddings",
+        label="Community",
+        property_name="embedding",
+        dimensions=1536
+    )
@@ -0,0 +1,166 @@
+from services.neo4j_client import neo4j_client
+from collections import OrderedDict
+from dotenv import load_dotenv
+from typing import List, Dict, Optional, Tuple
+import hashlib
+import os
+import re
+import threading
+import zlib
+import numpy as np
+
+load_dotenv()
+
+# MinHash signature: BANDS * ROWS permutations
+BANDS = 16
+ROWS = 4
+NUM_PERMUTATIONS = BANDS * ROWS
+
+# Word shingle size
+SHINGLE_SIZE = 5
+
+# Estimated Jaccard similarity at or above which a chunk counts as a near duplicate
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', '0.9'))
+
+# Collections whose LSH index is kept in memory
+MAX_INDEXED_COLLECTIONS = int(os.getenv('DEDUP_MAX_COLLECTIONS', '32'))
+
+# Prime just above 2**32, so (a * x + b) stays within uint64
+_PRIME = np.uint64(4294967311)
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, 2 ** 32 - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+_B = _rng.randint(0, 2 ** 32 - 1, size=NUM_PERMUTATIONS, dtype=np.uint64)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'\s+', ' ', text.lower()).strip()
+
+
+def content_hash(text: str) -> str:
+    """Hash of the normalized text, for exact duplicate detection."""
+    return hashlib.sha1(_normalize(text).encode('utf-8')).hexdigest()
+
+
+def minhash(text: str) -> List[int]:
+    """
+    MinHash signature over word shingles.
+
+    Args:
+        text: Text to sign
+
+    Returns:
+        NUM_PERMUTATIONS ints, stable across processes
+    """
+    words = _normalize(text).split(' ')
+    if len(words) <= SHINGLE_SIZE:
+        shingles = {' '.join(words)}
+    else:
+        shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+    hashes = np.array([zlib.crc32(s.encode('utf-8')) for s in shingles], dtype=np.uint64)
+    permuted = (np.outer(hashes, _A) + _B) % _PRIME
+    return permuted.min(axis=0).astype(np.int64).tolist()
+
+
+class LSHIndex:
+    """
+    In-memory locality-sensitive hashing index over canonical chunks of one collection.
+
+    Signatures are split into BANDS bands of ROWS values; chunks sharing any
+    band are candidates, confirmed by estimated Jaccard similarity.
+    """
+
+    def __init__(self):
+        self.hashes: Dict[str, str] = {}
+        self.signatures: Dict[str, np.ndarray] = {}
+        self.buckets: List[Dict[Tuple, List[str]]] = [{} for _ in range(BANDS)]
+        self.lock = threading.Lock()
+
+    def add(self, chunk_id: str, text_hash: str, signature: List[int]) -> None:
+        with self.lock:
+            self.hashes.setdefault(text_hash, chunk_id)
+            self.signatures[chunk_id] = np.array(signature)
+            for band in range(BANDS):
+                key = tuple(signature[band * ROWS:(band + 1) * ROWS])
+                self.buckets[band].setdefault(key, []).append(chunk_id)
+
+    def remove(self, chunk_id: str) -> None:
+        """Drop a chunk (e.g. one being rewritten, possibly as a duplicate)."""
+        with self.lock:
+            signature = self.signatures.pop(chunk_id, None)
+            if signature is None:
+                return
+            for text_hash in [h for h, c in self.hashes.items() if c == chunk_id]:
+                del self.hashes[text_hash]
+            for band in range(BANDS):
+                key = tuple(signature[band * ROWS:(band + 1) * ROWS].tolist())
+                bucket = self.buckets[band].get(key)
+                if bucket and chunk_id in bucket:
+                    bucket.remove(chunk_id)
+                    if not bucket:
+                        del self.buckets[band][key]
+
+    def find(self, text_hash: str, signature: List[int]) -> Optional[Tuple[str, float]]:
+        """
+        Find a canonical chunk this text duplicates.
+
+        Returns:
+            (chunk ID, estimated similarity) of the best match, or None
+        """
+        with self.lock:
+            if text_hash in self.hashes:
+                return self.hashes[text_hash], 1.0
+
+            candidates = set()
+            for band in range(BANDS):
+                key = tuple(signature[band * ROWS:(band + 1) * ROWS])
+                candidates.update(self.buckets[band].get(key, []))
+            if not candidates:
+                return None
+
+            signature = np.array(signature)
+            best = max(
+                ((chunk_id, float((self.signatures[chunk_id] == signature).mean())) for chunk_id in candidates),
+                key=lambda match: match[1]
+            )
+            return best if best[1] >= NEAR_DUPLICATE_THRESHOLD else None
+
+
+_indexes: "OrderedDict[str, LSHIndex]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def _load_index(collection_id: str) -> LSHIndex:
+    index = LSHIndex()
+    rows = neo4j_client.read("""
+        MATCH (:Collection {id: $collection_id})-[:HAS_DOC]->(:Document)<-[:SECTION_OF]-(ch:Chunk)
+        WHERE ch.minhash IS NOT NULL AND NOT (ch)-[:DUPLICATE_OF]->(:Chunk)
+        RETURN ch.id as chunk_id, ch.content_hash as content_hash, ch.minhash as minhash
+    """, {"collection_id": collection_id})
+    for row in rows:
+        index.add(row["chunk_id"], row["content_hash"], row["minhash"])
+    return index
+
+
+def get_index(collection_id: str) -> LSHIndex:
+    """Return the LSH index of a collection, loading it from Neo4j on first use."""
+    with _indexes_lock:
+        index = _indexes.get(collection_id)
+        if index is not None:
+            _indexes.move_to_end(collection_id)
+            return index
+
+    index = _load_index(collection_id)
+    with _indexes_lock:
+        # Another request may have loaded it meanwhile; keep the first one
+        index = _indexes.setdefault(collection_id, index)
+        _indexes.move_to_end(collection_id)
+        while len(_indexes) > MAX_INDEXED_COLLECTIONS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def forget(collection_id: str) -> None:
+    """Drop a collection's in-memory index (e.g. after deletions); it reloads on next use."""
+    with _indexes_lock:
+        _indexes.pop(collection_id, None)
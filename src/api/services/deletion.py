@@ -0,0 +1,244 @@
+from services.neo4j_client import neo4j_client
+from services.chunk_context import refresh_chunk_context
+from services.gds import refresh_after_ingest
+from services import dedup, entity_matcher
+from dotenv import load_dotenv
+from typing import List, Dict, Set, Optional
+import os
+import time
+
+load_dotenv()
+
+# Max nodes/relationships removed per transaction
+DELETE_BATCH_SIZE = int(os.getenv('DELETE_BATCH_SIZE', '500'))
+
+# Pause between batches so live queries keep their latency
+DELETE_THROTTLE = float(os.getenv('DELETE_THROTTLE', '0.1'))
+
+
+def _progress(job, **progress) -> None:
+    if job is not None:
+        job.update(**progress)
+
+
+def _delete_chunks(doc_id: str, job=None) -> Set[str]:
+    """
+    Delete a document's chunks in bounded batches.
+
+    Returns:
+        IDs of entities the deleted chunks mentioned (orphan candidates)
+    """
+    entity_ids = set()
+    deleted = 0
+
+    while True:
+        rows = neo4j_client.write("""
+            MATCH (:Document {id: $doc_id})<-[:SECTION_OF]-(ch:Chunk)
+            WITH ch LIMIT $batch_size
+            OPTIONAL MATCH (ch)-[:MENTIONS]->(e:Entity)
+            WITH ch, collect(e.id) AS entity_ids
+            // Promote one duplicate of a canonical chunk to take its place,
+            // never one of the document's own chunks (they are deleted too)
+            OPTIONAL MATCH (dup:Chunk)-[:DUPLICATE_OF]->(ch)
+            WHERE NOT (dup)-[:SECTION_OF]->(:Document {id: $doc_id})
+            WITH ch, entity_ids, collect(dup) AS duplicates
+            FOREACH (heir IN duplicates[..1] |
+                SET heir.embedding = ch.embedding,
+                    heir.minhash = ch.minhash,
+                    heir.centrality = ch.centrality
+                REMOVE heir.similarity
+                FOREACH (other IN duplicates[1..] |
+                    MERGE (other)-[:DUPLICATE_OF]->(heir)))
+            DETACH DELETE ch
+            RETURN entity_ids
+        """, {"doc_id": doc_id, "batch_size": DELETE_BATCH_SIZE})
+        if not rows:
+            break
+
+        for row in rows:
+            entity_ids.update(row["entity_ids"])
+        deleted += len(rows)
+        _progress(job, chunks_deleted=deleted)
+        time.sleep(DELETE_THROTTLE)
+
+    return entity_ids
+
+
+def collect_orphans(entity_ids: List[str], job=None) -> Dict:
+    """
+    Delete entities that no chunk mentions anymore, with their relationships.
+
+    RELATES_TO edges of orphans are removed in bounded batches first, so a
+    hub entity cannot turn into one huge transaction. Chunks of surviving
+    neighbours get their materialized context refreshed.
+
+    Args:
+        entity_ids: Candidate entity IDs
+
+    Returns:
+        Counts of deleted entities and relationships
+    """
+    entity_ids = list(entity_ids)
+    orphans = []
+    for start in range(0, len(entity_ids), DELETE_BATCH_SIZE):
+        rows = neo4j_client.read("""
+            UNWIND $entity_ids AS entity_id
+            MATCH (e:Entity {id: entity_id})
+            WHERE NOT (e)<-[:MENTIONS]-(:Chunk)
+            RETURN e.id as entity_id
+        """, {"entity_ids": entity_ids[start:start + DELETE_BATCH_SIZE]})
+        orphans.extend(row["entity_id"] for row in rows)
+
+    neighbours = set()
+    deleted_ids = set()
+    relationships_deleted = 0
+    entities_deleted = 0
+
+    for start in range(0, len(orphans), DELETE_BATCH_SIZE):
+        batch = orphans[start:start + DELETE_BATCH_SIZE]
+
+        while True:
+            rows = neo4j_client.write("""
+                UNWIND $entity_ids AS entity_id
+                MATCH (e:Entity {id: entity_id})
+                // Re-check: an upload may have mentioned it since
+                WHERE NOT (e)<-[:MENTIONS]-(:Chunk)
+                MATCH (e)-[r:RELATES_TO]-(other:Entity)
+                WITH DISTINCT r, other LIMIT $batch_size
+                DELETE r
+                RETURN other.id as neighbour_id
+            """, {"entity_ids": batch, "batch_size": DELETE_BATCH_SIZE})
+            if not rows:
+                break
+            neighbours.update(row["neighbour_id"] for row in rows)
+            relationships_deleted += len(rows)
+            _progress(job, relationships_deleted=relationships_deleted)
+            time.sleep(DELETE_THROTTLE)
+
+        rows = neo4j_client.write("""
+            UNWIND $entity_ids AS entity_id
+            MATCH (e:Entity {id: entity_id})
+            WHERE NOT (e)<-[:MENTIONS]-(:Chunk)
+            DETACH DELETE e
+            RETURN entity_id
+        """, {"entity_ids": batch})
+        deleted_ids.update(row["entity_id"] for row in rows)
+        entities_deleted += len(rows)
+        _progress(job, entities_deleted=entities_deleted)
+        time.sleep(DELETE_THROTTLE)
+
+    survivors = neighbours.difference(deleted_ids)
+    if survivors:
+        refresh_chunk_context(entity_ids=list(survivors))
+
+    return {
+        "entities_deleted": entities_deleted,
+        "relationships_deleted": relationships_deleted
+    }
+
+
+def _delete_document(doc_id: str, job=None) -> Dict:
+    _progress(job, phase="chunks", document_id=doc_id)
+    entity_ids = _delete_chunks(doc_id, job)
+
+    neo4j_client.write("""
+        MATCH (d:Document {id: $doc_id})
+        DETACH DELETE d
+    """, {"doc_id": doc_id})
+
+    _progress(job, phase="orphans")
+    stats = collect_orphans(list(entity_ids), job)
+
+    return {"document_id": doc_id, **stats}
+
+
+def delete_document(doc_id: str, collection_id: Optional[str] = None, job=None) -> Dict:
+    """
+    Delete a document, its chunks and any entities left orphaned.
+
+    Meant to run as a background job (see services/jobs.py).
+
+    Args:
+        doc_id: Document ID
+        collection_id: Collection of the document, to refresh its centrality after
+        job: Job to report progress to (optional)
+
+    Returns:
+        Summary of deleted data
+    """
+    stats = _delete_document(doc_id, job)
+
+    if collection_id:
+        dedup.forget(collection_id)
+        entity_matcher.forget(collection_id)
+        refresh_after_ingest(collection_id)
+    _progress(job, phase="done")
+
+    return stats
+
+
+def delete_collection(collection_id: str, job=None) -> Dict:
+    """
+    Delete a collection with all its documents, entities and communities.
+
+    Documents are removed one at a time in batched transactions, then any
+    remaining collection entities, community summaries and the collection
+    node itself.
+
+    Args:
+        collection_id: Collection ID
+        job: Job to report progress to (optional)
+
+    Returns:
+        Summary of deleted data
+    """
+    doc_ids = [
+        row["doc_id"]
+        for row in neo4j_client.read("""
+            MATCH (:Collection {id: $collection_id})-[:HAS_DOC]->(d:Document)
+            RETURN DISTINCT d.id as doc_id
+        """, {"collection_id": collection_id})
+    ]
+
+    totals = {"documents_deleted": 0, "entities_deleted": 0, "relationships_deleted": 0}
+    for doc_id in doc_ids:
+        stats = _delete_document(doc_id, job)
+        totals["documents_deleted"] += 1
+        totals["entities_deleted"] += stats["entities_deleted"]
+        totals["relationships_deleted"] += stats["relationships_deleted"]
+        _progress(job, documents_deleted=totals["documents_deleted"], documents_total=len(doc_ids))
+
+    # Entities of the collection that no document mentions
+    _progress(job, phase="entities")
+    entity_ids = [
+        row["entity_id"]
+        for row in neo4j_client.read("""
+            MATCH (e:Entity)-[:IN_COLLECTION]->(:Collection {id: $collection_id})
+            RETURN DISTINCT e.id as entity_id
+        """, {"collection_id": collection_id})
+    ]
+    stats = collect_orphans(entity_ids, job)
+    totals["entities_deleted"] += stats["entities_deleted"]
+    totals["relationships_deleted"] += stats["relationships_deleted"]
+
+    _progress(job, phase="communities")
+    while True:
+        rows = neo4j_client.write("""
+            MATCH (cm:Community {collection_id: $collection_id})
+            WITH cm LIMIT $batch_size
+            DETACH DELETE cm
+            RETURN count(*) as deleted
+        """, {"collection_id": collection_id, "batch_size": DELETE_BATCH_SIZE})
+        if not rows or not rows[0]["deleted"]:
+            break
+        time.sleep(DELETE_THROTTLE)
+
+    neo4j_client.write("""
+        MATCH (c:Collection {id: $collection_id})
+        DETACH DELETE c
+    """, {"collection_id": collection_id})
+    dedup.forget(collection_id)
+    entity_matcher.forget(collection_id)
+    _progress(job, phase="done")
+
+    return {"collection_id": collection_id, **totals}
@@ -1,10 +1,8 @@
-from openai import OpenAI
 from typing import List
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from services.llm import get_provider, INTERACTIVE
 import tiktoken
 
-client = OpenAI()
-
 def _count_tokens(text: str) -> int:
     """
     Count tokens using tiktoken for accurate measurement.
@@ -43,20 +41,32 @@ def chunk(text: str, chunk_size: int = 500, chunk_overlap: int = 50) -> List[str
     return chunks
 
 
-def embed(input: str) -> List[float]:
+def embed(input: str, priority: int = INTERACTIVE) -> List[float]:
     """
     Generate embeddings using OpenAI's text-embedding-3-small model.
     
     Args:
         input: Text to embed
+        priority: Rate-limit priority class (INTERACTIVE or INGEST)
         
     Returns:
         Embedding vector as list of floats (1536 dimensions)
     """
-    response = client.embeddings.create(
-        input=input,
-        model='text-embedding-3-small'
-    )
+    return get_provider().embed([input], priority=priority)[0]
+
+def embed_batch(inputs: List[str], priority: int = INTERACTIVE, batch_size: int = 256) -> List[List[float]]:
+    """
+    Generate embeddings for many texts with as few API requests as possible.
     
-    # Extract the actual vector from response
-    return response.data[0].embedding
\ No newline at end of file
+    Args:
+        inputs: Texts to embed
+        priority: Rate-limit priority class (INTERACTIVE or INGEST)
+        batch_size: Maximum number of texts per embeddings request
+        
+    Returns:
+        Embedding vectors in input order
+    """
+    vectors = []
+    for start in range(0, len(inputs), batch_size):
+        vectors.extend(get_provider().embed(inputs[start:start + batch_size], priority=priority))
+    return vectors
@@ -0,0 +1,264 @@
+from services.neo4j_client import neo4j_client
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from typing import List, Dict, Iterable, Optional
+import os
+import re
+import threading
+
+load_dotenv()
+
+# Bound on names held in memory across all collections
+MAX_PATTERNS = int(os.getenv('ENTITY_MATCHER_MAX_PATTERNS', '500000'))
+
+# Names added since the last full automaton build, matched by a small
+# delta automaton; past this many the full automaton is rebuilt
+MAX_DELTA_PATTERNS = int(os.getenv('ENTITY_MATCHER_MAX_DELTA', '2000'))
+
+# Names shorter than this (after normalization) are too ambiguous to match
+MIN_PATTERN_LENGTH = 3
+
+# Full automaton rebuilds run here, off the ingest and query threads
+_rebuild_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='entity-matcher')
+
+
+def _normalize(text: str) -> str:
+    """Lowercase and collapse punctuation/whitespace; padded so matches land on word boundaries."""
+    return " " + re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip() + " "
+
+
+class Automaton:
+    """
+    Aho-Corasick automaton over normalized entity names.
+
+    Finds every occurrence of every pattern in one pass over the text,
+    independent of the number of patterns.
+    """
+
+    def __init__(self, patterns: Dict[str, set]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[List[str]] = [[]]
+
+        for pattern in patterns:
+            state = 0
+            for char in pattern:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(pattern)
+
+        # Breadth-first failure links
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                if self.fail[next_state] == next_state:
+                    self.fail[next_state] = 0
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def find(self, text: str) -> List[str]:
+        """Return the distinct patterns occurring in (normalized) text."""
+        found = []
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            found.extend(self.output[state])
+        return list(dict.fromkeys(found))
+
+
+class _CollectionMatcher:
+    """
+    Names of one collection.
+
+    Text is matched against a full automaton plus a small delta automaton
+    over names added since the full one was built. Both are built outside
+    the lock and swapped in; full rebuilds run on a background thread, so
+    neither ingest nor queries wait for one.
+    """
+
+    def __init__(self):
+        self.patterns: Dict[str, set] = {}
+        self.names: Dict[str, str] = {}
+        self.automaton: Optional[Automaton] = None
+        # Patterns not yet in the full automaton, and their delta automaton
+        self.pending: set = set()
+        self.delta: Optional[Automaton] = None
+        self.version = 0
+        self.rebuilding = False
+        self.lock = threading.Lock()
+
+    def _add(self, entity_id: str, names: Iterable[str]) -> None:
+        """Add names of an entity; the caller holds the lock."""
+        for name in names:
+            if not name:
+                continue
+            pattern = _normalize(name)
+            if len(pattern.strip()) < MIN_PATTERN_LENGTH:
+                continue
+            if pattern not in self.patterns:
+                self.patterns[pattern] = set()
+                self.pending.add(pattern)
+                self.delta = None
+                self.version += 1
+            self.patterns[pattern].add(entity_id)
+            self.names.setdefault(entity_id, name)
+
+    def build(self) -> None:
+        """Build the full automaton from scratch (for a matcher not yet shared)."""
+        self.automaton = Automaton(self.patterns)
+        self.pending.clear()
+        self.delta = None
+
+    def add(self, entities: List[Dict]) -> None:
+        """
+        Add entities; once the delta grows past MAX_DELTA_PATTERNS, schedule
+        a background rebuild of the full automaton.
+        """
+        with self.lock:
+            for entity in entities:
+                self._add(entity["id"], [entity["name"]] + list(entity.get("aliases") or []))
+            if len(self.pending) < MAX_DELTA_PATTERNS or self.rebuilding:
+                return
+            self.rebuilding = True
+        _rebuild_executor.submit(self._rebuild)
+
+    def _rebuild(self) -> None:
+        """Build the full automaton from a snapshot and swap it in, until the delta is small again."""
+        while True:
+            with self.lock:
+                snapshot = list(self.patterns)
+
+            try:
+                automaton = Automaton(snapshot)
+            except Exception as e:
+                print(f"Entity matcher rebuild failed: {e}")
+                with self.lock:
+                    self.rebuilding = False
+                return
+
+            with self.lock:
+                self.automaton = automaton
+                self.pending.difference_update(snapshot)
+                self.delta = None
+                self.version += 1
+                # Names added during the build may already need another one
+                if len(self.pending) < MAX_DELTA_PATTERNS:
+                    self.rebuilding = False
+                    return
+
+    def match(self, text: str) -> List[Dict]:
+        with self.lock:
+            automaton, delta, version = self.automaton, self.delta, self.version
+            pending = list(self.pending) if delta is None and self.pending else None
+
+        if pending:
+            delta = Automaton(pending)
+            with self.lock:
+                if self.version == version:
+                    self.delta = delta
+
+        normalized = _normalize(text)
+        found = automaton.find(normalized) if automaton else []
+        if delta:
+            found = list(dict.fromkeys(found + delta.find(normalized)))
+
+        matches = []
+        with self.lock:
+            for pattern in found:
+                for entity_id in sorted(self.patterns.get(pattern, ())):
+                    matches.append({"id": entity_id, "name": self.names[entity_id]})
+        return matches
+
+
+_matchers: "OrderedDict[str, _CollectionMatcher]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _load(collection_id: str) -> _CollectionMatcher:
+    matcher = _CollectionMatcher()
+    rows = neo4j_client.read("""
+        MATCH (e:Entity)-[:IN_COLLECTION]->(:Collection {id: $collection_id})
+        RETURN DISTINCT e.id as id, e.name as name, e.aliases as aliases
+    """, {"collection_id": collection_id})
+    for row in rows:
+        matcher._add(row["id"], [row["name"]] + list(row["aliases"] or []))
+    matcher.build()
+    return matcher
+
+
+def _evict() -> None:
+    """Drop least recently used collections until the pattern bound holds (keeps at least one)."""
+    total = sum(len(m.patterns) for m in _matchers.values())
+    while total > MAX_PATTERNS and len(_matchers) > 1:
+        _, evicted = _matchers.popitem(last=False)
+        total -= len(evicted.patterns)
+
+
+def match_entities(text: str, collection_ids: List[str]) -> List[Dict]:
+    """
+    Find known entities of the given collections mentioned in text.
+
+    Args:
+        text: Query text
+        collection_ids: Collections whose entity names to match
+
+    Returns:
+        Matched entities as {id, name}
+    """
+    matches = []
+    for collection_id in collection_ids:
+        with _lock:
+            matcher = _matchers.get(collection_id)
+            if matcher is not None:
+                _matchers.move_to_end(collection_id)
+
+        if matcher is None:
+            loaded = _load(collection_id)
+            with _lock:
+                matcher = _matchers.setdefault(collection_id, loaded)
+                _matchers.move_to_end(collection_id)
+                _evict()
+
+        matches.extend(matcher.match(text))
+    return matches
+
+
+def add_entities(collection_id: str, entities: List[Dict]) -> None:
+    """
+    Incrementally add newly ingested entities to a collection's matcher.
+
+    Only updates collections already held in memory; others load in full on
+    first use anyway.
+
+    Args:
+        collection_id: Collection the entities belong to
+        entities: Entities as {id, name, aliases (optional)}
+    """
+    with _lock:
+        matcher = _matchers.get(collection_id)
+    if matcher is None:
+        return
+
+    matcher.add(entities)
+    with _lock:
+        _evict()
+
+
+def forget(collection_id: str) -> None:
+    """Drop a collection's matcher (e.g. after deletions); it reloads on next use."""
+    with _lock:
+        _matchers.pop(collection_id, None)
@@ -1 +1,373 @@
-# Graph Data Science (Neo4j's graph algorithms library)
\ No newline at end of file
+# Graph Data Science (Neo4j's graph algorithms library)
+#
+# Precomputes graph features for Entity nodes of a collection (PageRank,
+# degree, community id) and an aggregated centrality score per Chunk, so the
+# reranker can read a single number instead of counting relationships.
+# Uses Neo4j GDS when the plugin is installed, otherwise a local NumPy
+# implementation over the exported adjacency.
+from services.neo4j_client import neo4j_client
+from services.chunk_context import refresh_chunk_context
+from typing import List, Dict, Tuple, Optional
+import hashlib
+import numpy as np
+import threading
+import uuid
+
+# Values closer than this to the stored ones are not written back
+CHANGE_TOLERANCE = 1e-4
+
+# Max rows per UNWIND write
+WRITE_BATCH_SIZE = 1000
+
+_gds_available = None
+
+
+def gds_available() -> bool:
+    """Check (once) whether the Neo4j GDS plugin is installed."""
+    global _gds_available
+    if _gds_available is None:
+        try:
+            neo4j_client.read("RETURN gds.version() AS version")
+            _gds_available = True
+        except Exception:
+            _gds_available = False
+    return _gds_available
+
+
+def export_graph(collection_id: str) -> Tuple[List[Dict], List[Tuple[str, str]]]:
+    """
+    Export the Entity graph of a collection.
+
+    Args:
+        collection_id: Collection to export
+
+    Returns:
+        Tuple of (entities with their stored feature values, ordered by id,
+        and RELATES_TO edges as id pairs)
+    """
+    entities = neo4j_client.read("""
+        MATCH (e:Entity)-[:IN_COLLECTION]->(:Collection {id: $collection_id})
+        RETURN DISTINCT
+            e.id as id,
+            e.pagerank as pagerank,
+            e.degree as degree,
+            e.community as community,
+            e.centrality as centrality
+        ORDER BY id
+    """, {"collection_id": collection_id})
+
+    edges = neo4j_client.read("""
+        MATCH (a:Entity)-[:IN_COLLECTION]->(:Collection {id: $collection_id})
+        WITH DISTINCT a
+        MATCH (a)-[:RELATES_TO]->(b:Entity)
+        RETURN a.id as source, b.id as target
+    """, {"collection_id": collection_id})
+
+    return entities, [(row["source"], row["target"]) for row in edges]
+
+
+def pagerank(
+    n: int,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    damping: float = 0.85,
+    iterations: int = 50,
+    tolerance: float = 1e-6
+) -> np.ndarray:
+    """
+    PageRank by power iteration over an edge list.
+
+    Args:
+        n: Number of nodes
+        sources: Source node index per edge
+        targets: Target node index per edge
+        damping: Damping factor
+        iterations: Maximum iterations
+        tolerance: L1 convergence threshold
+
+    Returns:
+        PageRank score per node (sums to 1)
+    """
+    if n == 0:
+        return np.zeros(0)
+
+    out_degree = np.bincount(sources, minlength=n).astype(float)
+    dangling = out_degree == 0
+    rank = np.full(n, 1.0 / n)
+
+    for _ in range(iterations):
+        contributions = rank[sources] / out_degree[sources]
+        new_rank = np.bincount(targets, weights=contributions, minlength=n)
+        # Dangling nodes spread their rank evenly
+        new_rank = damping * (new_rank + rank[dangling].sum() / n) + (1 - damping) / n
+        converged = np.abs(new_rank - rank).sum() < tolerance
+        rank = new_rank
+        if converged:
+            break
+
+    return rank
+
+
+def degree(n: int, sources: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """Undirected degree per node."""
+    return np.bincount(sources, minlength=n) + np.bincount(targets, minlength=n)
+
+
+def label_propagation(
+    n: int,
+    sources: np.ndarray,
+    targets: np.ndarray,
+    weights: Optional[np.ndarray] = None,
+    iterations: int = 10
+) -> np.ndarray:
+    """
+    Deterministic label propagation community detection (undirected).
+
+    Each node repeatedly adopts the label with the highest total edge weight
+    among its neighbours; ties go to the smallest label.
+
+    Args:
+        n: Number of nodes
+        sources: Source node index per edge
+        targets: Target node index per edge
+        weights: Optional weight per edge (default 1)
+        iterations: Maximum sweeps over all nodes
+
+    Returns:
+        Compact community id (0..k-1) per node
+    """
+    if weights is None:
+        weights = np.ones(len(sources))
+
+    neighbours = [[] for _ in range(n)]
+    for s, t, w in zip(sources.tolist(), targets.tolist(), weights.tolist()):
+        if s != t:
+            neighbours[s].append((t, w))
+            neighbours[t].append((s, w))
+
+    labels = list(range(n))
+    for _ in range(iterations):
+        changed = False
+        for node in range(n):
+            if not neighbours[node]:
+                continue
+            totals = {}
+            for other, w in neighbours[node]:
+                totals[labels[other]] = totals.get(labels[other], 0.0) + w
+            best = min(totals, key=lambda label: (-totals[label], label))
+            if best != labels[node]:
+                labels[node] = best
+                changed = True
+        if not changed:
+            break
+
+    _, compact = np.unique(np.array(labels, dtype=int), return_inverse=True)
+    return compact
+
+
+def _compute_local(ids: List[str], edges: List[Tuple[str, str]]) -> Dict[str, np.ndarray]:
+    index = {entity_id: i for i, entity_id in enumerate(ids)}
+    pairs = [(index[s], index[t]) for s, t in edges if s in index and t in index]
+    sources = np.array([s for s, _ in pairs], dtype=int)
+    targets = np.array([t for _, t in pairs], dtype=int)
+    n = len(ids)
+
+    return {
+        "pagerank": pagerank(n, sources, targets),
+        "degree": degree(n, sources, targets),
+        "community": label_propagation(n, sources, targets)
+    }
+
+
+def _compute_gds(collection_id: str, ids: List[str]) -> Dict[str, np.ndarray]:
+    graph_name = f"centrality_{uuid.uuid4().hex}"
+    neo4j_client.query("""
+        MATCH (source:Entity)-[:IN_COLLECTION]->(:Collection {id: $collection_id})
+        WITH DISTINCT source
+        OPTIONAL MATCH (source)-[:RELATES_TO]->(target:Entity)
+        WITH gds.graph.project($graph_name, source, target) AS g
+        RETURN g.graphName AS graph_name
+    """, {"collection_id": collection_id, "graph_name": graph_name})
+
+    try:
+        streams = {
+            "pagerank": "CALL gds.pageRank.stream($graph_name) YIELD nodeId, score",
+            "degree": "CALL gds.degree.stream($graph_name, {orientation: 'UNDIRECTED'}) YIELD nodeId, score",
+            "community": "CALL gds.labelPropagation.stream($graph_name) YIELD nodeId, communityId AS score"
+        }
+        index = {entity_id: i for i, entity_id in enumerate(ids)}
+        values = {}
+        for name, call in streams.items():
+            rows = neo4j_client.query(
+                call + " RETURN gds.util.asNode(nodeId).id AS id, score",
+                {"graph_name": graph_name}
+            )
+            column = np.zeros(len(ids))
+            for row in rows:
+                if row["id"] in index:
+                    column[index[row["id"]]] = row["score"]
+            values[name] = column
+    finally:
+        neo4j_client.query(
+            "CALL gds.graph.drop($graph_name, false) YIELD graphName RETURN graphName",
+            {"graph_name": graph_name}
+        )
+
+    return values
+
+
+def _stable_id(entity_id: str) -> int:
+    """Non-negative 63-bit integer derived from an entity id."""
+    return int.from_bytes(hashlib.blake2b(entity_id.encode('utf-8'), digest_size=8).digest(), 'big') >> 1
+
+
+def canonical_communities(ids: List[str], labels: np.ndarray) -> np.ndarray:
+    """
+    Replace run-dependent community labels by ids derived from each
+    community's smallest member id, so unchanged communities keep their id
+    when unrelated entities are added.
+    """
+    smallest = {}
+    for entity_id, label in zip(ids, labels.tolist()):
+        if label not in smallest or entity_id < smallest[label]:
+            smallest[label] = entity_id
+    return np.array([_stable_id(smallest[label]) for label in labels.tolist()], dtype=np.int64)
+
+
+def _changed(old, new) -> bool:
+    if old is None:
+        return True
+    if isinstance(new, float):
+        return abs(old - new) > CHANGE_TOLERANCE
+    return old != new
+
+
+def refresh_centrality(collection_id: str, use_gds: Optional[bool] = None) -> Dict:
+    """
+    Recompute graph features for a collection and write back what changed.
+
+    Entities get `pagerank`, `degree`, `community` (stable across runs, see
+    canonical_communities) and `centrality` (PageRank scaled to 0-1 by the
+    collection maximum). Chunks get
+    `centrality = 1 - exp(-sum of mentioned entity centralities)`, recomputed
+    only for chunks that mention an entity whose centrality changed or have
+    no value yet. Chunks whose stored context ranks relationships to an
+    entity with changed centrality get their context rebuilt.
+
+    Args:
+        collection_id: Collection to refresh
+        use_gds: Force (True) or skip (False) Neo4j GDS; auto-detect if None
+
+    Returns:
+        Summary of updated entities, chunks and chunk contexts
+    """
+    entities, edges = export_graph(collection_id)
+    # Same node order on every run, so label propagation's tie-breaks are stable
+    entities.sort(key=lambda e: e["id"])
+    ids = [e["id"] for e in entities]
+    if not ids:
+        return {"collection_id": collection_id, "entities": 0, "chunks": 0}
+
+    if use_gds is None:
+        use_gds = gds_available()
+
+    if use_gds:
+        values = _compute_gds(collection_id, ids)
+    else:
+        values = _compute_local(ids, edges)
+    values["community"] = canonical_communities(ids, values["community"])
+
+    max_rank = values["pagerank"].max() or 1.0
+
+    updates = []
+    centrality_changed = []
+    for i, entity in enumerate(entities):
+        new = {
+            "pagerank": float(values["pagerank"][i]),
+            "degree": int(values["degree"][i]),
+            "community": int(values["community"][i]),
+            "centrality": float(values["pagerank"][i] / max_rank)
+        }
+        if any(_changed(entity[key], value) for key, value in new.items()):
+            updates.append({"id": entity["id"], **new})
+        if _changed(entity["centrality"], new["centrality"]):
+            centrality_changed.append(entity["id"])
+
+    for start in range(0, len(updates), WRITE_BATCH_SIZE):
+        neo4j_client.write("""
+            UNWIND $updates AS u
+            MATCH (e:Entity {id: u.id})
+            SET e.pagerank = u.pagerank,
+                e.degree = u.degree,
+                e.community = u.community,
+                e.centrality = u.centrality
+        """, {"updates": updates[start:start + WRITE_BATCH_SIZE]})
+
+    # Chunks mentioning entities whose centrality changed, plus chunks never scored
+    rows = neo4j_client.read("""
+        UNWIND $entity_ids AS entity_id
+        MATCH (:Entity {id: entity_id})<-[:MENTIONS]-(ch:Chunk)
+        RETURN DISTINCT ch.id as chunk_id
+        UNION
+        MATCH (:Collection {id: $collection_id})-[:HAS_DOC]->(:Document)<-[:SECTION_OF]-(ch:Chunk)
+        WHERE ch.centrality IS NULL
+        RETURN ch.id as chunk_id
+    """, {"entity_ids": centrality_changed, "collection_id": collection_id})
+    chunk_ids = [row["chunk_id"] for row in rows]
+
+    for start in range(0, len(chunk_ids), WRITE_BATCH_SIZE):
+        neo4j_client.write("""
+            UNWIND $chunk_ids AS chunk_id
+            MATCH (ch:Chunk {id: chunk_id})
+            OPTIONAL MATCH (ch)-[:MENTIONS]->(e:Entity)
+            WITH ch, sum(coalesce(e.centrality, 0.0)) AS total
+            SET ch.centrality = 1 - exp(-total)
+        """, {"chunk_ids": chunk_ids[start:start + WRITE_BATCH_SIZE]})
+
+    # Stored chunk contexts rank relationships by target centrality, so
+    # rebuild them for chunks mentioning an entity that points to a changed one
+    changed = set(centrality_changed)
+    contexts = refresh_chunk_context(entity_ids=sorted({s for s, t in edges if t in changed})) if changed else 0
+
+    return {
+        "collection_id": collection_id,
+        "entities": len(updates),
+        "chunks": len(chunk_ids),
+        "contexts": contexts
+    }
+
+
+_refresh_lock = threading.Lock()
+_running = set()
+_pending = set()
+
+
+def refresh_after_ingest(collection_id: str) -> None:
+    """
+    Refresh centrality for a collection after an ingest.
+
+    Meant to run as a background task. If a refresh for the same collection
+    is already running, this only marks it for one more pass, so bursts of
+    uploads collapse into at most one extra refresh.
+    """
+    with _refresh_lock:
+        if collection_id in _running:
+            _pending.add(collection_id)
+            return
+        _running.add(collection_id)
+
+    try:
+        while True:
+            stats = refresh_centrality(collection_id)
+            print(f"Refreshed centrality: {stats}")
+            with _refresh_lock:
+                if collection_id not in _pending:
+                    # Stop in the same critical section, so a later upload starts its own refresh
+                    _running.discard(collection_id)
+                    break
+                _pending.discard(collection_id)
+    except Exception as e:
+        print(f"Centrality refresh for {collection_id} failed: {e}")
+        with _refresh_lock:
+            _running.discard(collection_id)
+            _pending.discard(collection_id)
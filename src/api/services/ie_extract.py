@@ -1,8 +1,6 @@
-from openai import OpenAI
 from pydantic import BaseModel, Field
 from typing import List
-
-client = OpenAI()
+from services.llm import get_provider, INGEST
 
 
 class Entity(BaseModel):
@@ -47,11 +45,10 @@ Text:
 {text}
 """
     
-    response = client.beta.chat.completions.parse(
-        model=model,
+    return get_provider().parse(
         messages=[{"role": "user", "content": prompt}],
-        response_format=ExtractionResult
+        response_format=ExtractionResult,
+        model=model,
+        priority=INGEST
     )
-    
-    return response.choices[0].message.parsed
 
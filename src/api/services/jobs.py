@@ -0,0 +1,93 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import os
+import threading
+import time
+import uuid
+
+# Background jobs are heavy maintenance work; keep few running at once
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('JOB_WORKERS', '1')),
+    thread_name_prefix='jobs'
+)
+
+# Finished jobs kept for status lookups
+MAX_FINISHED_JOBS = 200
+
+
+class Job:
+    """A background job with progress reporting."""
+
+    def __init__(self, kind: str, params: Dict[str, Any]):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = "pending"
+        self.progress: Dict[str, Any] = {}
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def update(self, **progress) -> None:
+        """Merge progress counters/fields into the job's progress."""
+        self.progress.update(progress)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at
+        }
+
+
+_jobs: Dict[str, Job] = {}
+_lock = threading.Lock()
+
+
+def _run(job: Job, fn: Callable[..., Dict]) -> None:
+    job.status = "running"
+    try:
+        job.result = fn(job=job, **job.params)
+        job.status = "completed"
+    except Exception as e:
+        print(f"Job {job.id} ({job.kind}) failed: {e}")
+        job.error = str(e)
+        job.status = "failed"
+    finally:
+        job.finished_at = time.time()
+
+
+def submit(kind: str, fn: Callable[..., Dict], **params) -> Job:
+    """
+    Queue fn(job=..., **params) to run in the background.
+
+    Args:
+        kind: Job type label (e.g. "delete_document")
+        fn: Function doing the work; receives the Job to report progress
+        **params: Arguments for fn
+
+    Returns:
+        The queued Job
+    """
+    job = Job(kind, params)
+    with _lock:
+        finished = [j for j in _jobs.values() if j.finished_at is not None]
+        finished.sort(key=lambda j: j.finished_at)
+        for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS + 1)]:
+            del _jobs[old.id]
+        _jobs[job.id] = job
+    _executor.submit(_run, job, fn)
+    return job
+
+
+def get_job(job_id: str) -> Optional[Job]:
+    """Look up a job by ID."""
+    with _lock:
+        return _jobs.get(job_id)
@@ -0,0 +1,378 @@
+from dotenv import load_dotenv
+from typing import List, Dict, Any, Optional, Callable, Type
+import asyncio
+import hashlib
+import math
+import os
+import random
+import threading
+import time
+
+load_dotenv()
+
+# Priority classes: lower value is served first
+INTERACTIVE = 0
+INGEST = 1
+
+EMBEDDING_MODEL = 'text-embedding-3-small'
+EMBEDDING_DIMENSIONS = 1536
+
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'openai')
+LLM_RPM = int(os.getenv('LLM_RPM', '500'))
+LLM_TPM = int(os.getenv('LLM_TPM', '200000'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '5'))
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '50'))
+# Share of the bucket that ingest traffic is never allowed to consume
+LLM_INTERACTIVE_RESERVE = float(os.getenv('LLM_INTERACTIVE_RESERVE', '0.2'))
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token) used for TPM accounting."""
+    return max(1, len(text) // 4)
+
+
+class RateLimiter:
+    """
+    Shared RPM/TPM token bucket with priority classes.
+
+    Both buckets refill continuously. Ingest requests may only take capacity
+    while no interactive request is waiting and while the buckets stay above
+    the interactive reserve, so bulk uploads cannot starve live queries.
+    """
+
+    def __init__(self, rpm: int, tpm: int, interactive_reserve: float = 0.2):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.interactive_reserve = interactive_reserve
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._updated = time.monotonic()
+        self._waiting_interactive = 0
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def _try_acquire(self, tokens: int, priority: int) -> float:
+        """
+        Take capacity if available.
+
+        Returns:
+            0 if acquired, otherwise the number of seconds to wait before retrying
+        """
+        with self._lock:
+            self._refill()
+
+            if priority == INTERACTIVE:
+                request_floor, token_floor = 0.0, 0.0
+            else:
+                if self._waiting_interactive:
+                    return 0.05
+                request_floor = min(self.rpm * self.interactive_reserve, self.rpm - 1)
+                token_floor = self.tpm * self.interactive_reserve
+
+            # Requests larger than the bucket above their floor could never be
+            # admitted; clamp them
+            tokens = min(tokens, self.tpm - token_floor)
+
+            request_deficit = request_floor + 1 - self._requests
+            token_deficit = token_floor + tokens - self._tokens
+            if request_deficit <= 0 and token_deficit <= 0:
+                self._requests -= 1
+                self._tokens -= tokens
+                return 0.0
+
+            return max(
+                request_deficit * 60 / self.rpm,
+                token_deficit * 60 / self.tpm,
+                0.01
+            )
+
+    def _set_waiting(self, priority: int, delta: int) -> None:
+        if priority == INTERACTIVE:
+            with self._lock:
+                self._waiting_interactive += delta
+
+    def acquire(self, tokens: int, priority: int = INTERACTIVE) -> None:
+        """Block until the request fits into the bucket."""
+        wait = self._try_acquire(tokens, priority)
+        if not wait:
+            return
+        self._set_waiting(priority, 1)
+        try:
+            while wait:
+                time.sleep(wait)
+                wait = self._try_acquire(tokens, priority)
+        finally:
+            self._set_waiting(priority, -1)
+
+    async def acquire_async(self, tokens: int, priority: int = INTERACTIVE) -> None:
+        """Async variant of acquire that yields to the event loop while waiting."""
+        wait = self._try_acquire(tokens, priority)
+        if not wait:
+            return
+        self._set_waiting(priority, 1)
+        try:
+            while wait:
+                await asyncio.sleep(wait)
+                wait = self._try_acquire(tokens, priority)
+        finally:
+            self._set_waiting(priority, -1)
+
+
+def _backoff(attempt: int, base: float = 0.5, cap: float = 20.0) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class OpenAIProvider:
+    """
+    OpenAI-backed provider.
+
+    Sync and async clients are created lazily on first use and share a pooled
+    HTTP connection limit. Retries are handled here (not by the SDK) so that
+    every attempt goes through the shared rate limiter.
+    """
+
+    def __init__(self, limiter: RateLimiter, max_retries: int = 5, timeout: float = 60.0):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    from openai import OpenAI, DefaultHttpxClient
+                    self._client = OpenAI(
+                        max_retries=0,
+                        timeout=self.timeout,
+                        http_client=DefaultHttpxClient(
+                            limits=httpx.Limits(
+                                max_connections=LLM_MAX_CONNECTIONS,
+                                max_keepalive_connections=LLM_MAX_CONNECTIONS
+                            )
+                        )
+                    )
+        return self._client
+
+    @property
+    def async_client(self):
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+                    self._async_client = AsyncOpenAI(
+                        max_retries=0,
+                        timeout=self.timeout,
+                        http_client=DefaultAsyncHttpxClient(
+                            limits=httpx.Limits(
+                                max_connections=LLM_MAX_CONNECTIONS,
+                                max_keepalive_connections=LLM_MAX_CONNECTIONS
+                            )
+                        )
+                    )
+        return self._async_client
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        import openai
+        return isinstance(error, (
+            openai.RateLimitError,
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.InternalServerError
+        ))
+
+    def _call(self, fn: Callable[[], Any], tokens: int, priority: int) -> Any:
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(tokens, priority)
+            try:
+                return fn()
+            except Exception as e:
+                if attempt == self.max_retries or not self._is_retryable(e):
+                    raise
+                time.sleep(_backoff(attempt))
+
+    async def _acall(self, fn: Callable[[], Any], tokens: int, priority: int) -> Any:
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire_async(tokens, priority)
+            try:
+                return await fn()
+            except Exception as e:
+                if attempt == self.max_retries or not self._is_retryable(e):
+                    raise
+                await asyncio.sleep(_backoff(attempt))
+
+    def embed(self, inputs: List[str], priority: int = INTERACTIVE) -> List[List[float]]:
+        tokens = sum(estimate_tokens(text) for text in inputs)
+        response = self._call(
+            lambda: self.client.embeddings.create(input=inputs, model=EMBEDDING_MODEL),
+            tokens,
+            priority
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    async def aembed(self, inputs: List[str], priority: int = INTERACTIVE) -> List[List[float]]:
+        tokens = sum(estimate_tokens(text) for text in inputs)
+        response = await self._acall(
+            lambda: self.async_client.embeddings.create(input=inputs, model=EMBEDDING_MODEL),
+            tokens,
+            priority
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda d: d.index)]
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "gpt-4o-mini",
+        temperature: float = 0,
+        priority: int = INTERACTIVE
+    ) -> str:
+        tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        response = self._call(
+            lambda: self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature
+            ),
+            tokens,
+            priority
+        )
+        return response.choices[0].message.content
+
+    async def achat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "gpt-4o-mini",
+        temperature: float = 0,
+        priority: int = INTERACTIVE
+    ) -> str:
+        tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        response = await self._acall(
+            lambda: self.async_client.chat.completions.create(
+                model=model,
+                messages=messages,
+                temperature=temperature
+            ),
+            tokens,
+            priority
+        )
+        return response.choices[0].message.content
+
+    def parse(
+        self,
+        messages: List[Dict[str, str]],
+        response_format: Type,
+        model: str = "gpt-4o-mini",
+        priority: int = INTERACTIVE
+    ) -> Any:
+        tokens = sum(estimate_tokens(m["content"]) for m in messages)
+        response = self._call(
+            lambda: self.client.beta.chat.completions.parse(
+                model=model,
+                messages=messages,
+                response_format=response_format
+            ),
+            tokens,
+            priority
+        )
+        return response.choices[0].message.parsed
+
+
+class LocalProvider:
+    """
+    Deterministic offline stand-in for tests and local runs.
+
+    Embeddings are hashed bag-of-words vectors (so similar texts get similar
+    vectors), chat echoes the last message, and structured parsing returns an
+    empty instance of the requested model. An optional latency simulates a
+    remote API.
+    """
+
+    def __init__(self, latency: float = 0.0, dimensions: int = EMBEDDING_DIMENSIONS):
+        self.latency = latency
+        self.dimensions = dimensions
+
+    def _vector(self, text: str) -> List[float]:
+        vector = [0.0] * self.dimensions
+        for word in text.lower().split():
+            digest = hashlib.md5(word.encode('utf-8')).digest()
+            index = int.from_bytes(digest[:4], 'little') % self.dimensions
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    @staticmethod
+    def _empty(response_format: Type) -> Any:
+        values = {}
+        for name, field in response_format.model_fields.items():
+            origin = getattr(field.annotation, '__origin__', field.annotation)
+            values[name] = origin() if origin in (list, dict, str, int, float, bool) else None
+        return response_format.model_construct(**values)
+
+    def embed(self, inputs: List[str], priority: int = INTERACTIVE) -> List[List[float]]:
+        time.sleep(self.latency)
+        return [self._vector(text) for text in inputs]
+
+    async def aembed(self, inputs: List[str], priority: int = INTERACTIVE) -> List[List[float]]:
+        await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in inputs]
+
+    def chat(self, messages: List[Dict[str, str]], model: str = "gpt-4o-mini",
+             temperature: float = 0, priority: int = INTERACTIVE) -> str:
+        time.sleep(self.latency)
+        return messages[-1]["content"][:500]
+
+    async def achat(self, messages: List[Dict[str, str]], model: str = "gpt-4o-mini",
+                    temperature: float = 0, priority: int = INTERACTIVE) -> str:
+        await asyncio.sleep(self.latency)
+        return messages[-1]["content"][:500]
+
+    def parse(self, messages: List[Dict[str, str]], response_format: Type,
+              model: str = "gpt-4o-mini", priority: int = INTERACTIVE) -> Any:
+        time.sleep(self.latency)
+        return self._empty(response_format)
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider():
+    """
+    Return the process-wide provider, creating it on first use.
+
+    Set LLM_PROVIDER=local to use the deterministic offline provider.
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                if LLM_PROVIDER == 'local':
+                    _provider = LocalProvider(latency=float(os.getenv('LLM_LOCAL_LATENCY', '0')))
+                else:
+                    _provider = OpenAIProvider(
+                        RateLimiter(LLM_RPM, LLM_TPM, LLM_INTERACTIVE_RESERVE),
+                        max_retries=LLM_MAX_RETRIES,
+                        timeout=LLM_TIMEOUT
+                    )
+    return _provider
+
+
+def set_provider(provider: Optional[Any]) -> None:
+    """Replace the process-wide provider (e.g. with a LocalProvider in tests)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
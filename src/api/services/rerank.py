@@ -1,4 +1,5 @@
 from typing import List, Dict
+import numpy as np
 
 
 def rerank(results: List[Dict], top_k: int = 10) -> List[Dict]:
@@ -7,8 +8,8 @@ def rerank(results: List[Dict], top_k: int = 10) -> List[Dict]:
     
     Simple scoring based on:
     - Vector similarity score (from initial search)
-    - Number of entity connections (graph richness)
-    - Boost for results with more context
+    - Graph richness: precomputed chunk centrality (see services/gds.py),
+      or the number of entity connections if it is not available yet
     
     Args:
         results: List of search results from Neo4j
@@ -38,8 +39,14 @@ def calculate_score(result: Dict) -> float:
     
     Scoring factors:
     - Base similarity score (0-1) - weight: 0.6
-    - Entity count (normalized) - weight: 0.2
-    - Relationship count (normalized) - weight: 0.2
+    - Graph score (0-1) - weight: 0.4
+    
+    The graph score is the chunk's precomputed `centrality` when present.
+    Otherwise it falls back to counting the returned entities (capped at 10)
+    and relationships (capped at 15), weighted equally.
+    
+    Chunks mentioning entities matched in the query (`seed_hits`) get a
+    boost of 0.05 per seed, up to two, capped at 1.
     
     Args:
         result: Single search result
@@ -50,23 +57,84 @@ def calculate_score(result: Dict) -> float:
     # Get base similarity score (from vector search)
     similarity_score = result.get("score", 0.5)
     
-    # Count entities mentioned in this chunk
-    entity_count = len(result.get("entities", []))
-    
-    # Count relationships connected to these entities
-    relationship_count = len(result.get("relationships", []))
-    
-    # Normalize entity and relationship counts (sigmoid-like)
-    # More entities/relationships = richer context
-    entity_score = min(entity_count / 10, 1.0)  # Cap at 10 entities
-    relationship_score = min(relationship_count / 15, 1.0)  # Cap at 15 relationships
+    centrality = result.get("centrality")
+    if centrality is not None:
+        graph_score = centrality
+    else:
+        # Count entities mentioned in this chunk and relationships connected to them
+        entity_count = len(result.get("entities", []))
+        relationship_count = len(result.get("relationships", []))
+        
+        # Normalize entity and relationship counts
+        # More entities/relationships = richer context
+        entity_score = min(entity_count / 10, 1.0)  # Cap at 10 entities
+        relationship_score = min(relationship_count / 15, 1.0)  # Cap at 15 relationships
+        graph_score = 0.5 * entity_score + 0.5 * relationship_score
     
     # Weighted combination
     combined_score = (
         0.6 * similarity_score +
-        0.2 * entity_score +
-        0.2 * relationship_score
+        0.4 * graph_score
     )
     
+    # Boost chunks that mention entities named in the query
+    seed_hits = result.get("seed_hits") or 0
+    if seed_hits:
+        combined_score = min(combined_score + 0.05 * min(seed_hits, 2), 1.0)
+    
     return combined_score
 
+
+def rerank_batch(result_groups: List[List[Dict]], top_k: int = 10) -> List[List[Dict]]:
+    """
+    Rerank the results of many queries in one vectorized pass.
+    
+    Uses the same scoring as calculate_score, computed with NumPy over all
+    results of all queries at once.
+    
+    Args:
+        result_groups: One list of search results per query
+        top_k: Number of top results to return per query
+        
+    Returns:
+        Reranked results per query, in input order
+    """
+    flat = [result for group in result_groups for result in group]
+    if not flat:
+        return [[] for _ in result_groups]
+    
+    similarity = np.array([r.get("score", 0.5) for r in flat], dtype=float)
+    entity_counts = np.array([len(r.get("entities", [])) for r in flat], dtype=float)
+    relationship_counts = np.array([len(r.get("relationships", [])) for r in flat], dtype=float)
+    
+    centrality = np.array(
+        [np.nan if r.get("centrality") is None else r["centrality"] for r in flat],
+        dtype=float
+    )
+    
+    count_score = (
+        0.5 * np.minimum(entity_counts / 10, 1.0) +
+        0.5 * np.minimum(relationship_counts / 15, 1.0)
+    )
+    graph_score = np.where(np.isnan(centrality), count_score, centrality)
+    
+    seed_hits = np.array([r.get("seed_hits") or 0 for r in flat], dtype=float)
+    
+    scores = np.minimum(
+        0.6 * similarity + 0.4 * graph_score + 0.05 * np.minimum(seed_hits, 2),
+        np.where(seed_hits > 0, 1.0, np.inf)
+    )
+    
+    reranked = []
+    offset = 0
+    for group in result_groups:
+        group_scores = scores[offset:offset + len(group)]
+        # Stable descending sort, matching rerank()
+        order = np.argsort(-group_scores, kind="stable")[:top_k]
+        reranked.append([
+            {**group[i], "rerank_score": float(group_scores[i])}
+            for i in order
+        ])
+        offset += len(group)
+    
+    return reranked
@@ -0,0 +1,509 @@
+from services.neo4j_client import neo4j_client
+from services.chunk_context import build_chunk_contexts
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import List, Dict, Optional, Tuple
+import json
+import os
+
+# Max queries sent to Neo4j in a single UNWIND call
+BATCH_QUERY_SIZE = 50
+
+# Shared pool for per-collection fan-out
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv('SEARCH_FANOUT_WORKERS', '16')),
+    thread_name_prefix='search-fanout'
+)
+
+# Filter vector hits to the collection and count how many of the query's
+# seed entities (from the entity matcher) each chunk mentions.
+# Expects `node` and `score` in scope.
+_COLLECTION_FILTER = """
+        // Filter by collection
+        MATCH (node)-[:SECTION_OF]->(d:Document)
+        MATCH (d)<-[:HAS_DOC]-(c:Collection {id: $collection_id})
+        MATCH (c)<-[:HAS_COLLECTION]-(w:Workspace {id: $workspace_id})
+
+        // Seed entities matched in the query
+        WITH node, score, d,
+             size([(node)-[:MENTIONS]->(s:Entity) WHERE s.id IN $seed_ids | s]) as seed_hits
+"""
+
+# Chunk columns that can be projected with `fields=`, and their Cypher expressions
+_FIELD_EXPRESSIONS = {
+    "chunk_id": "node.id",
+    "content": "node.content",
+    "chunk_index": "node.index",
+    "document_id": "d.id",
+    "filename": "d.filename",
+    "centrality": "node.centrality",
+    "seed_hits": "seed_hits",
+    "score": "score",
+}
+
+# Always fetched, since ranking and pagination need them
+_REQUIRED_FIELDS = ("chunk_id", "centrality", "seed_hits", "score")
+
+GRAPH_FIELDS = ("entities", "relationships")
+PROJECTABLE_FIELDS = tuple(_FIELD_EXPRESSIONS) + GRAPH_FIELDS
+
+# Expand to entities and every outgoing relationship of each entity.
+_EXPAND_MATCH = """
+        // Get connected entities
+        OPTIONAL MATCH (node)-[:MENTIONS]->(e:Entity)
+
+        // Get relationships between entities
+        OPTIONAL MATCH (e)-[r:RELATES_TO]->(related:Entity)
+"""
+_EXPAND_RETURNS = (
+    "collect(DISTINCT {name: e.name, type: e.type}) as entities",
+    """collect(DISTINCT {
+                source: e.name,
+                target: related.name,
+                type: r.kind
+            }) as relationships""",
+)
+
+# Mentioned entities only; relationships are added afterwards by expand_multihop.
+_ENTITIES_MATCH = """
+        // Get connected entities
+        OPTIONAL MATCH (node)-[:MENTIONS]->(e:Entity)
+"""
+_ENTITIES_RETURNS = ("collect(DISTINCT {id: e.id, name: e.name, type: e.type}) as entities",)
+
+# The chunk's materialized context record (maintained at ingest) instead of
+# traversing the graph.
+_CONTEXT_RETURNS = ("node.context as context",)
+
+
+def _filter_and_return(fields: List[str] = None, match: str = "", extra_returns: Tuple = ()) -> str:
+    """Build the collection filter and RETURN clause, projecting chunk columns to `fields`."""
+    returns = [
+        f"{expression} as {name}"
+        for name, expression in _FIELD_EXPRESSIONS.items()
+        if fields is None or name in fields or name in _REQUIRED_FIELDS
+    ]
+    returns.extend(extra_returns)
+    return (
+        _COLLECTION_FILTER + match + """
+        RETURN
+            """ + ",\n            ".join(returns) + """
+        ORDER BY score DESC
+"""
+    )
+
+
+_FILTER_AND_EXPAND = _filter_and_return(None, _EXPAND_MATCH, _EXPAND_RETURNS)
+
+
+def search_chunks(
+    query_vector: List[float],
+    workspace_id: str,
+    collection_id: str,
+    limit: int = 10,
+    expansion: str = "direct",
+    hops: int = 2,
+    fanout: int = 10,
+    edge_budget: int = 100,
+    seed_entity_ids: List[str] = None,
+    fields: List[str] = None
+) -> List[Dict]:
+    """
+    Vector search for chunks in a collection with entity/relationship expansion.
+
+    Args:
+        query_vector: Query embedding
+        workspace_id: User/project workspace ID
+        collection_id: Collection to search in
+        limit: Number of nearest chunks to fetch from the vector index
+        expansion: "direct" follows every outgoing RELATES_TO edge of each
+            mentioned entity; "multihop" uses bounded expansion (see expand_multihop);
+            "materialized" reads the context stored on each chunk at ingest
+        hops: Max hops from mentioned entities (multihop only)
+        fanout: Max neighbours kept per entity per hop (multihop only)
+        edge_budget: Max relationships kept for the whole search (multihop only)
+        seed_entity_ids: Entities matched in the query; chunks mentioning
+            them report it in `seed_hits`, and multihop expansion favours
+            edges through them
+        fields: Chunk properties to return (see PROJECTABLE_FIELDS); columns
+            not listed are not fetched, and without "entities" or
+            "relationships" no graph expansion runs at all. Ranking fields
+            (chunk_id, score, centrality, seed_hits) are always returned.
+
+    Returns:
+        Matching chunks ordered by similarity score
+    """
+    params = {
+        "query_vector": query_vector,
+        "workspace_id": workspace_id,
+        "collection_id": collection_id,
+        "limit": limit,
+        "seed_ids": seed_entity_ids or []
+    }
+    vector_search = """
+        CALL db.index.vector.queryNodes('chunk_embeddings', $limit, $query_vector)
+        YIELD node, score
+    """
+
+    if fields is not None and not any(field in fields for field in GRAPH_FIELDS):
+        return neo4j_client.read(vector_search + _filter_and_return(fields), params)
+
+    if expansion == "materialized":
+        results = neo4j_client.read(
+            vector_search + _filter_and_return(fields, extra_returns=_CONTEXT_RETURNS), params
+        )
+        return unpack_contexts(results)
+
+    if expansion == "multihop":
+        results = neo4j_client.read(
+            vector_search + _filter_and_return(fields, _ENTITIES_MATCH, _ENTITIES_RETURNS), params
+        )
+        return expand_multihop(
+            results, hops=hops, fanout=fanout, edge_budget=edge_budget, seed_entity_ids=seed_entity_ids
+        )
+
+    return neo4j_client.read(
+        vector_search + _filter_and_return(fields, _EXPAND_MATCH, _EXPAND_RETURNS), params
+    )
+
+
+def unpack_contexts(results: List[Dict]) -> List[Dict]:
+    """
+    Turn each chunk's stored `context` JSON into `entities` and `relationships`.
+
+    Chunks ingested before context was materialized have none stored; theirs
+    is built from the graph on the fly.
+    """
+    missing = [r["chunk_id"] for r in results if not r.get("context")]
+    built = build_chunk_contexts(missing) if missing else {}
+
+    unpacked = []
+    for result in results:
+        stored = result.pop("context", None)
+        context = json.loads(stored) if stored else built.get(result["chunk_id"], {})
+        unpacked.append({
+            **result,
+            "entities": context.get("entities", []),
+            "relationships": context.get("relationships", [])
+        })
+    return unpacked
+
+
+def expand_multihop(
+    results: List[Dict],
+    hops: int = 2,
+    fanout: int = 10,
+    edge_budget: int = 100,
+    seed_entity_ids: List[str] = None
+) -> List[Dict]:
+    """
+    Attach relationships found by bounded breadth-first expansion.
+
+    Starting from the entities each chunk mentions, follows RELATES_TO edges
+    (either direction) for up to `hops` hops. Each entity keeps at most
+    `fanout` neighbours, highest precomputed centrality/degree first, and
+    the whole expansion keeps at most `edge_budget` edges, so hub entities
+    cannot blow up the query. Costs one Cypher round trip per hop.
+
+    Seed entities (named in the query) steer the expansion: they rank first
+    among an entity's neighbours, and edges touching them are kept before
+    any others when the budget runs short.
+
+    Args:
+        results: Chunks with `entities` carrying entity ids
+        hops: Max hops from mentioned entities
+        fanout: Max neighbours kept per entity per hop
+        edge_budget: Max relationships kept across all chunks
+        seed_entity_ids: Entities matched in the query
+
+    Returns:
+        The same chunks with a `relationships` list (each edge has its `hop`)
+    """
+    seeds = set(seed_entity_ids or [])
+
+    # Which chunks reach each entity
+    origins = {}
+    for i, result in enumerate(results):
+        for entity in result["entities"]:
+            if entity.get("id"):
+                origins.setdefault(entity["id"], set()).add(i)
+
+    relationships = [[] for _ in results]
+    seen = [set() for _ in results]
+    kept = set()
+    visited = set(origins)
+    frontier = list(origins)
+
+    for hop in range(1, hops + 1):
+        if not frontier or len(kept) >= edge_budget:
+            break
+
+        rows = neo4j_client.read("""
+            UNWIND $frontier AS entity_id
+            MATCH (e:Entity {id: entity_id})
+            CALL {
+                WITH e
+                MATCH (e)-[r:RELATES_TO]-(n:Entity)
+                RETURN r, n
+                ORDER BY n.id IN $seed_ids DESC, coalesce(n.centrality, 0) DESC, coalesce(n.degree, 0) DESC
+                LIMIT $fanout
+            }
+            RETURN
+                e.id as from_id,
+                n.id as to_id,
+                startNode(r).name as source,
+                endNode(r).name as target,
+                r.kind as type,
+                coalesce(n.centrality, 0) as weight
+        """, {"frontier": frontier, "fanout": fanout, "seed_ids": list(seeds)})
+
+        # Spend the budget on edges touching seeds, then the most informative ones
+        rows.sort(key=lambda row: (row["from_id"] in seeds or row["to_id"] in seeds, row["weight"]), reverse=True)
+
+        next_frontier = []
+        for row in rows:
+            edge = (row["source"], row["type"], row["target"])
+            if edge not in kept:
+                if len(kept) >= edge_budget:
+                    continue
+                kept.add(edge)
+
+            for i in origins[row["from_id"]]:
+                if edge not in seen[i]:
+                    seen[i].add(edge)
+                    relationships[i].append({
+                        "source": row["source"],
+                        "target": row["target"],
+                        "type": row["type"],
+                        "hop": hop
+                    })
+
+            origins.setdefault(row["to_id"], set()).update(origins[row["from_id"]])
+            if row["to_id"] not in visited:
+                visited.add(row["to_id"])
+                next_frontier.append(row["to_id"])
+
+        frontier = next_frontier
+
+    return [
+        {**result, "relationships": rels}
+        for result, rels in zip(results, relationships)
+    ]
+
+
+def search_chunks_batch(
+    query_vectors: List[List[float]],
+    workspace_id: str,
+    collection_id: str,
+    limit: int = 10
+) -> List[List[Dict]]:
+    """
+    Run search_chunks for many query vectors with one UNWIND call per batch.
+
+    Args:
+        query_vectors: Query embeddings
+        workspace_id: User/project workspace ID
+        collection_id: Collection to search in
+        limit: Number of nearest chunks to fetch per query
+
+    Returns:
+        One result list per query vector, in input order
+    """
+    grouped = [[] for _ in query_vectors]
+
+    for start in range(0, len(query_vectors), BATCH_QUERY_SIZE):
+        queries = [
+            {"index": start + i, "vector": vector}
+            for i, vector in enumerate(query_vectors[start:start + BATCH_QUERY_SIZE])
+        ]
+
+        rows = neo4j_client.read("""
+            UNWIND $queries AS q
+            CALL {
+                WITH q
+                CALL db.index.vector.queryNodes('chunk_embeddings', $limit, q.vector)
+                YIELD node, score
+        """ + _FILTER_AND_EXPAND + """
+            }
+            RETURN q.index as query_index, chunk_id, content, chunk_index,
+                   document_id, filename, centrality, seed_hits, score, entities, relationships
+        """, {
+            "queries": queries,
+            "workspace_id": workspace_id,
+            "collection_id": collection_id,
+            "limit": limit,
+            "seed_ids": []
+        })
+
+        for row in rows:
+            grouped[row.pop("query_index")].append(row)
+
+    return grouped
+
+
+def list_collections(workspace_id: str) -> List[str]:
+    """Return the IDs of all collections in a workspace."""
+    rows = neo4j_client.read("""
+        MATCH (w:Workspace {id: $workspace_id})-[:HAS_COLLECTION]->(c:Collection)
+        RETURN DISTINCT c.id as collection_id
+        ORDER BY collection_id
+    """, {"workspace_id": workspace_id})
+    return [row["collection_id"] for row in rows]
+
+
+def score_range(results: List[Dict]) -> Optional[Tuple[float, float]]:
+    """(min, max) similarity score of results, or None if empty."""
+    if not results:
+        return None
+    scores = [r["score"] for r in results]
+    return min(scores), max(scores)
+
+
+def normalize_scores(results: List[Dict], bounds: Tuple[float, float] = None) -> List[Dict]:
+    """
+    Min-max normalize similarity scores over a set of results.
+
+    Keeps the original value as `raw_score`. If all scores are equal, every
+    result keeps its raw score, since there is no spread to normalize.
+
+    Args:
+        results: Results to normalize together
+        bounds: (min, max) to normalize with instead of the results' own
+            range, so scores stay comparable across pages fetched at
+            different depths
+    """
+    if not results:
+        return results
+
+    low, high = bounds or score_range(results)
+    if high == low:
+        return [{**r, "raw_score": r["score"]} for r in results]
+
+    return [
+        {**r, "raw_score": r["score"], "score": (r["score"] - low) / (high - low)}
+        for r in results
+    ]
+
+
+def search_collections(
+    query_vector: List[float],
+    workspace_id: str,
+    collection_ids: List[str],
+    limit: int = 10,
+    timeout: float = 5.0,
+    seed_entity_ids: List[str] = None,
+    fields: List[str] = None,
+    score_bounds: Tuple[float, float] = None,
+    **expand_options
+) -> Tuple[List[Dict], Dict]:
+    """
+    Search several collections concurrently under a shared deadline.
+
+    Each collection is searched on the fan-out pool. Branches that miss the
+    deadline or fail are left out and reported, so callers get partial
+    results rather than an error. With more than one collection, scores are
+    min-max normalized jointly over the merged results. All collections
+    share one embedding model, so raw similarities are already comparable
+    and a joint range keeps them on one scale.
+
+    Args:
+        query_vector: Query embedding
+        workspace_id: User/project workspace ID
+        collection_ids: Collections to search in
+        limit: Number of nearest chunks to fetch per collection
+        timeout: Shared deadline in seconds for all branches
+        seed_entity_ids: Entities matched in the query (see search_chunks)
+        fields: Chunk properties to return (see search_chunks)
+        score_bounds: (min, max) to normalize with, as returned in the info
+            of an earlier call; defaults to the merged results' own range
+        **expand_options: Graph expansion options passed to search_chunks
+
+    Returns:
+        Tuple of (merged results tagged with collection_id, fan-out info).
+        With several collections, the info's `score_bounds` holds the
+        normalization bounds used.
+    """
+    futures = {
+        collection_id: _executor.submit(
+            search_chunks, query_vector, workspace_id, collection_id, limit,
+            seed_entity_ids=seed_entity_ids, fields=fields, **expand_options
+        )
+        for collection_id in collection_ids
+    }
+    done, _ = wait(futures.values(), timeout=timeout)
+
+    merged = []
+    timed_out = []
+    failed = []
+    for collection_id, future in futures.items():
+        if future not in done:
+            future.cancel()
+            timed_out.append(collection_id)
+            continue
+        if future.exception() is not None:
+            print(f"Search in collection {collection_id} failed: {future.exception()}")
+            failed.append(collection_id)
+            continue
+
+        merged.extend({**r, "collection_id": collection_id} for r in future.result())
+
+    info = {
+        "collections": collection_ids,
+        "timed_out": timed_out,
+        "failed": failed,
+        "partial": bool(timed_out or failed)
+    }
+    if len(collection_ids) > 1:
+        bounds = score_bounds or score_range(merged)
+        merged = normalize_scores(merged, bounds)
+        info["score_bounds"] = bounds
+    return merged, info
+
+
+def search_communities(
+    query_vector: List[float],
+    workspace_id: str,
+    collection_ids: List[str],
+    limit: int = 8
+) -> List[Dict]:
+    """
+    Vector search over precomputed community summaries ("global" retrieval).
+
+    Args:
+        query_vector: Query embedding
+        workspace_id: User/project workspace ID
+        collection_ids: Collections whose communities to search
+        limit: Maximum number of summaries to return
+
+    Returns:
+        Matching community summaries ordered by similarity score
+    """
+    # The index is shared by all collections, so the nearest neighbours may
+    # belong to other collections; widen the search until enough match or
+    # the whole index has been scanned
+    total = neo4j_client.read("MATCH (cm:Community) RETURN count(cm) as total")[0]["total"]
+    candidates = limit * 5
+    while True:
+        results = neo4j_client.read("""
+            CALL db.index.vector.queryNodes('community_embeddings', $candidates, $query_vector)
+            YIELD node, score
+            WHERE node.collection_id IN $collection_ids
+            MATCH (:Workspace {id: $workspace_id})-[:HAS_COLLECTION]->(:Collection {id: node.collection_id})
+            RETURN DISTINCT
+                node.id as community_id,
+                node.collection_id as collection_id,
+                node.level as level,
+                node.size as size,
+                node.summary as content,
+                score
+            ORDER BY score DESC
+            LIMIT $limit
+        """, {
+            "query_vector": query_vector,
+            "workspace_id": workspace_id,
+            "collection_ids": collection_ids,
+            "candidates": candidates,
+            "limit": limit
+        })
+        if len(results) >= limit or candidates >= total:
+            return results
+        candidates = min(candidates * 4, total)
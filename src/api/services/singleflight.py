@@ -0,0 +1,158 @@
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+import asyncio
+import json
+import threading
+
+
+def make_key(
+    endpoint: str,
+    query: str,
+    workspace_id: str,
+    collection_id: Any,
+    **params
+) -> Tuple:
+    """
+    Build a coalescing key for a request.
+
+    The query is normalized (case and whitespace) so trivially different
+    spellings of the same question share one execution.
+
+    Args:
+        endpoint: Endpoint name (e.g. "search", "answer")
+        query: Raw query text
+        workspace_id: Workspace ID
+        collection_id: Collection ID (or list of IDs)
+        **params: Any other parameters that affect the result
+
+    Returns:
+        Hashable key
+    """
+    normalized = " ".join(query.lower().split())
+    return (
+        endpoint,
+        normalized,
+        workspace_id,
+        json.dumps(collection_id, sort_keys=True, default=str),
+        json.dumps(params, sort_keys=True, default=str)
+    )
+
+
+class _LeaderCancelled(Exception):
+    """Tells followers that the leader was cancelled and one of them must take over."""
+
+
+class _Call:
+    """An in-flight execution that followers can wait on."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent identical calls into a single execution.
+
+    The first caller for a key (the leader) runs the function; callers that
+    arrive while it is in flight wait and receive the same result (or error).
+    Results are not cached after the leader finishes.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, _Call] = {}
+        self._async_calls: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.executions = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn once per key among concurrent (threaded) callers."""
+        with self._lock:
+            self.requests += 1
+            call = self._calls.get(key)
+            if call is not None:
+                leader = False
+            else:
+                leader = True
+                call = self._calls[key] = _Call()
+                self.executions += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+    async def ado(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run the coroutine function once per key among concurrent async callers.
+
+        If the leader is cancelled (e.g. its client disconnected), the
+        followers are not: one of them takes over and runs fn again.
+        """
+        with self._lock:
+            self.requests += 1
+
+        while True:
+            with self._lock:
+                future = self._async_calls.get(key)
+                if future is None:
+                    future = asyncio.get_running_loop().create_future()
+                    self._async_calls[key] = future
+                    self.executions += 1
+                    leader = True
+                else:
+                    leader = False
+
+            if not leader:
+                try:
+                    # shield so a cancelled follower does not cancel the shared result
+                    return await asyncio.shield(future)
+                except _LeaderCancelled:
+                    continue
+
+            try:
+                result = await fn()
+                future.set_result(result)
+                return result
+            except asyncio.CancelledError:
+                future.set_exception(_LeaderCancelled())
+                future.exception()
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                # mark retrieved so an unawaited future does not log a warning
+                future.exception()
+                raise
+            finally:
+                with self._lock:
+                    if self._async_calls.get(key) is future:
+                        del self._async_calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return coalescing metrics."""
+        with self._lock:
+            coalesced = self.requests - self.executions
+            return {
+                "requests": self.requests,
+                "executions": self.executions,
+                "coalesced": coalesced,
+                "coalesce_rate": coalesced / self.requests if self.requests else 0.0,
+                "in_flight": len(self._calls) + len(self._async_calls)
+            }
+
+
+# Shared instance for the API routes
+singleflight = SingleFlight()
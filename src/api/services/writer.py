@@ -1,9 +1,24 @@
 from services.neo4j_client import neo4j_client
-from services.embeddings import chunk, embed
+from services.embeddings import chunk, embed, _count_tokens
 from services.ie_extract import extract
+from services.llm import INGEST, EMBEDDING_DIMENSIONS
+from services.chunk_context import refresh_chunk_context
+from services.dedup import get_index, content_hash, minhash
+from services import entity_matcher
+from dotenv import load_dotenv
 from typing import List, Dict
+import os
 import re
 
+load_dotenv()
+
+# USD per 1M input tokens, used to report spend saved by deduplication
+EMBEDDING_PRICE_PER_1M = float(os.getenv('EMBEDDING_PRICE_PER_1M', '0.02'))
+EXTRACTION_PRICE_PER_1M = float(os.getenv('EXTRACTION_PRICE_PER_1M', '0.15'))
+
+# Approximate tokens of the extraction prompt around the chunk text
+EXTRACTION_PROMPT_TOKENS = 100
+
 
 def normalize(name: str) -> str:
     """Normalize entity names for consistent IDs."""
@@ -42,10 +57,15 @@ def write_document(
     
     1. Create Document node
     2. Chunk text
-    3. Extract entities from each chunk
-    4. Create Chunk nodes with embeddings
-    5. Create Entity nodes
-    6. Create all relationships
+    3. Link exact/near-duplicate chunks to their canonical chunk, skipping
+       embedding and extraction for them
+    4. Extract entities from each remaining chunk
+    5. Create Chunk nodes with embeddings
+    6. Create Entity nodes
+    7. Create all relationships
+    8. Add new entities to the in-memory query entity matcher
+    9. Refresh the materialized context of new chunks and of older chunks
+       whose entities gained relationships
     
     Args:
         text: Document text
@@ -79,15 +99,87 @@ def write_document(
         "document_id": doc_id,
         "chunks": 0,
         "entities": 0,
-        "relationships": 0
+        "relationships": 0,
+        "duplicates": 0,
+        "near_duplicates": 0,
+        "tokens_saved": 0,
+        "cost_saved_usd": 0.0,
+        "bytes_saved": 0
     }
     
+    dedup_index = get_index(collection_id)
+    written_chunk_ids = []
+    related_entity_ids = set()
+    written_entities = []
+    
     # Process each chunk
     for i, chunk_text in enumerate(chunks):
         chunk_id = f"{doc_id}:chunk:{i}"
+        text_hash = content_hash(chunk_text)
+        signature = minhash(chunk_text)
+        
+        # A re-uploaded chunk is rewritten below, possibly in a different role
+        dedup_index.remove(chunk_id)
+        
+        # Link duplicates of an existing chunk instead of embedding/extracting again
+        match = dedup_index.find(text_hash, signature)
+        if match and match[0] != chunk_id:
+            canonical_id, similarity = match
+            neo4j_client.write("""
+                MATCH (d:Document {id: $doc_id})
+                MATCH (canonical:Chunk {id: $canonical_id})
+                MERGE (ch:Chunk {id: $chunk_id})
+                SET ch.content = $content,
+                    ch.index = $index,
+                    ch.content_hash = $content_hash,
+                    ch.similarity = $similarity
+                REMOVE ch.embedding, ch.minhash
+                MERGE (ch)-[:SECTION_OF]->(d)
+                WITH ch, canonical
+                // Drop links from a previous upload of this chunk; duplicates
+                // of it move to the new canonical
+                CALL {
+                    WITH ch
+                    OPTIONAL MATCH (ch)-[old:DUPLICATE_OF|MENTIONS]->()
+                    DELETE old
+                }
+                CALL {
+                    WITH ch, canonical
+                    OPTIONAL MATCH (other:Chunk)-[old:DUPLICATE_OF]->(ch)
+                    FOREACH (o IN CASE WHEN other IS NULL OR other = canonical THEN [] ELSE [other] END |
+                        MERGE (o)-[:DUPLICATE_OF]->(canonical))
+                    DELETE old
+                }
+                MERGE (ch)-[:DUPLICATE_OF]->(canonical)
+                WITH ch, canonical
+                OPTIONAL MATCH (canonical)-[:MENTIONS]->(e:Entity)
+                FOREACH (entity IN CASE WHEN e IS NULL THEN [] ELSE [e] END |
+                    MERGE (ch)-[:MENTIONS]->(entity))
+            """, {
+                "doc_id": doc_id,
+                "canonical_id": canonical_id,
+                "chunk_id": chunk_id,
+                "content": chunk_text,
+                "index": i,
+                "content_hash": text_hash,
+                "similarity": similarity
+            })
+            
+            tokens = _count_tokens(chunk_text)
+            stats["chunks"] += 1
+            stats["duplicates" if similarity == 1.0 else "near_duplicates"] += 1
+            stats["tokens_saved"] += 2 * tokens + EXTRACTION_PROMPT_TOKENS
+            stats["cost_saved_usd"] += (
+                tokens * EMBEDDING_PRICE_PER_1M +
+                (tokens + EXTRACTION_PROMPT_TOKENS) * EXTRACTION_PRICE_PER_1M
+            ) / 1_000_000
+            # Embedding stored as doubles
+            stats["bytes_saved"] += EMBEDDING_DIMENSIONS * 8
+            written_chunk_ids.append(chunk_id)
+            continue
         
         # Generate embedding
-        embedding = embed(chunk_text)
+        embedding = embed(chunk_text, priority=INGEST)
         
         # Extract entities and relationships
         extraction = extract(chunk_text)
@@ -98,16 +190,28 @@ def write_document(
             MERGE (ch:Chunk {id: $chunk_id})
             SET ch.content = $content,
                 ch.embedding = $embedding,
-                ch.index = $index
+                ch.index = $index,
+                ch.content_hash = $content_hash,
+                ch.minhash = $minhash
+            REMOVE ch.similarity
             MERGE (ch)-[:SECTION_OF]->(d)
+            WITH ch
+            // Drop links from a previous upload of this chunk (e.g. MENTIONS
+            // copied while it was a duplicate); extraction below re-adds them
+            OPTIONAL MATCH (ch)-[old:DUPLICATE_OF|MENTIONS]->()
+            DELETE old
         """, {
             "doc_id": doc_id,
             "chunk_id": chunk_id,
             "content": chunk_text,
             "embedding": embedding,
-            "index": i
+            "index": i,
+            "content_hash": text_hash,
+            "minhash": signature
         })
         stats["chunks"] += 1
+        written_chunk_ids.append(chunk_id)
+        dedup_index.add(chunk_id, text_hash, signature)
         
         # Create entities and relationships
         entity_ids = {}
@@ -130,6 +234,7 @@ def write_document(
                 "collection_id": collection_id
             })
             stats["entities"] += 1
+            written_entities.append({"id": entity_id, "name": entity.name})
         
         # Create entity relationships
         for rel in extraction.relationships:
@@ -147,6 +252,18 @@ def write_document(
                     "kind": rel.type
                 })
                 stats["relationships"] += 1
+                related_entity_ids.add(source_id)
+    
+    stats["cost_saved_usd"] = round(stats["cost_saved_usd"], 6)
+    
+    # Make new entities matchable in queries right away
+    entity_matcher.add_entities(collection_id, written_entities)
+    
+    # Keep denormalized chunk context in sync so retrieval needs no traversal
+    stats["contexts_refreshed"] = refresh_chunk_context(
+        chunk_ids=written_chunk_ids,
+        entity_ids=list(related_entity_ids)
+    )
     
     return stats
 
@@ -54,6 +54,8 @@ export default function Home() {
     try {
       const response = await fetch(`${API_URL}/ingest/upload`, {
         method: "POST",
+        // Lets the API's admission control attribute the upload to this workspace
+        headers: { "X-Workspace-Id": workspaceId },
         body: formData,
       });
       